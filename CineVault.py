@@ -1,5 +1,52 @@
 import os
+import csv
+import gzip
+import itertools
+import json
+import math
+import queue
+import shutil
 import sqlite3
+import tempfile
+import time
+import multiprocessing
+
+# Number of rows fetched from the database per export batch
+EXPORT_BATCH_ROWS = 100000
+
+# Number of rows written per executemany call and transaction when ingesting videos
+INSERT_BATCH_ROWS = 10000
+
+# Statement that adds a video or refreshes the size and times of one already in the table
+UPSERT_VIDEO_SQL = """
+    INSERT INTO video (file_name, directory, file_size, ctime, mtime) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(directory, file_name) DO UPDATE SET file_size=excluded.file_size, ctime=excluded.ctime, mtime=excluded.mtime
+"""
+
+# Default number of processes probing video metadata and seconds a single file may take
+PROBE_WORKERS = os.cpu_count() or 1
+PROBE_TIMEOUT = 30
+
+# Frames sampled per video for its perceptual hash, and the largest Hamming distance per frame
+# at which two videos still count as near-duplicates
+PHASH_FRAMES = 5
+PHASH_DISTANCE = 10
+
+# Metadata columns filled by probing; probe_size and probe_mtime record which version of the file was probed
+PROBE_COLUMNS = [("duration", "REAL"), ("width", "INTEGER"), ("height", "INTEGER"), ("fps", "REAL"),
+                 ("codec", "TEXT"), ("frame_count", "INTEGER"), ("probe_size", "INTEGER"),
+                 ("probe_mtime", "INTEGER"), ("probe_error", "TEXT"),
+                 ("phash", "TEXT"), ("phash_size", "INTEGER"), ("phash_mtime", "INTEGER")]
+
+# Statement storing the probe result of one video
+PROBE_UPDATE_SQL = """
+    UPDATE video SET duration=?, width=?, height=?, fps=?, codec=?, frame_count=?, probe_size=?, probe_mtime=?, probe_error=?
+    WHERE id=?
+"""
+
+# Columns written by the .csv, .jsonl, .parquet and .arrow exports; times are nanoseconds since the epoch
+EXPORT_COLUMNS = ["id", "file_name", "directory", "file_size", "ctime", "mtime",
+                  "duration", "width", "height", "fps", "codec", "frame_count"]
 
 def create_connection(db_file):
     """Create a connection to the SQLite database."""
@@ -11,28 +58,63 @@ def create_connection(db_file):
         return None
 
 def list_video_files(directory, include_subfolders=False):
-    """List video files in the given directory."""
+    """List video files in the given directory with their size in bytes and ctime/mtime in nanoseconds."""
     video_files = []
     for root, dirs, files in os.walk(directory):
         if include_subfolders or root == directory:
             for file in files:
                 if file.endswith((".mkv", ".mp4")):
-                    file_path = os.path.join(root, file)
-                    video_files.append((file, file_path, round(os.path.getsize(file_path) / (1024 ** 2))))
+                    st = os.stat(os.path.join(root, file))
+                    video_files.append((file, root, st.st_size, st.st_ctime_ns, st.st_mtime_ns))
     return video_files
 
 def create_video_table(conn):
-    """Create a video table in the database."""
+    """Create a video table in the database, converting tables that store sizes in MB."""
     try:
         cursor = conn.cursor()
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(video)")}
+        had_mb = "file_size_mb" in columns
+        if had_mb:
+            cursor.execute("ALTER TABLE video RENAME TO video_mb")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS video (
                 id INTEGER PRIMARY KEY,
                 file_name TEXT,
                 directory TEXT,
-                file_size_mb INTEGER
+                file_size INTEGER,
+                ctime INTEGER,
+                mtime INTEGER
             )
         """)
+        if had_mb:
+            cursor.execute("""
+                INSERT INTO video (id, file_name, directory, file_size)
+                SELECT id, file_name, directory, file_size_mb * 1048576 FROM video_mb
+            """)
+            cursor.execute("DROP TABLE video_mb")
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(video)")}
+        for column, column_type in PROBE_COLUMNS:
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE video ADD COLUMN {column} {column_type}")
+        indexes = {row[1] for row in cursor.execute("PRAGMA index_list(video)")}
+        if "idx_video_directory_file_name" not in indexes:
+            # Scans used to store the full file path as the directory; keep only the folder
+            cursor.execute("SELECT id, file_name, directory FROM video")
+            cursor.executemany("UPDATE video SET directory = ? WHERE id = ?",
+                               [(os.path.dirname(directory), video_id) for video_id, file_name, directory in cursor.fetchall()
+                                if directory and os.path.basename(directory) == file_name and not os.path.isdir(directory)])
+            # Keep the first row of each video so the unique index can be built
+            cursor.execute("""
+                DELETE FROM video WHERE id NOT IN (SELECT MIN(id) FROM video GROUP BY directory, file_name)
+            """)
+            cursor.execute("CREATE UNIQUE INDEX idx_video_directory_file_name ON video (directory, file_name)")
+        # Sizes and dates are formatted here rather than on every insert
+        cursor.execute("""
+            CREATE VIEW IF NOT EXISTS video_view AS
+            SELECT id, file_name, directory, CAST(ROUND(file_size / 1048576.0) AS INTEGER) AS file_size_mb,
+                   datetime(mtime / 1000000000, 'unixepoch', 'localtime') AS modified_date
+            FROM video
+        """)
         conn.commit()
     except sqlite3.Error as e:
         print(e)
@@ -41,55 +123,434 @@ def insert_video(conn, file_name, directory):
     """Insert a single video file into the database."""
     try:
         cursor = conn.cursor()
-        file_path = os.path.join(directory, file_name)
-        file_size_mb = round(os.path.getsize(file_path) / (1024 ** 2))
-        cursor.execute("INSERT INTO video (file_name, directory, file_size_mb) VALUES (?, ?, ?)", (file_name, directory, file_size_mb))
+        st = os.stat(os.path.join(directory, file_name))
+        cursor.execute(UPSERT_VIDEO_SQL, (file_name, directory, st.st_size, st.st_ctime_ns, st.st_mtime_ns))
+        conn.commit()
+    except sqlite3.Error as e:
+        print(e)
+
+def insert_videos(conn, videos, batch_rows=INSERT_BATCH_ROWS, verbose=True):
+    """Insert new video files and refresh changed ones, in batches of upserts."""
+    try:
+        cursor = conn.cursor()
+        # One query loads every known video, so unchanged files are skipped without touching the database
+        cursor.execute("SELECT directory, file_name, file_size, mtime FROM video")
+        known = {(directory, file_name): (file_size, mtime) for directory, file_name, file_size, mtime in cursor.fetchall()}
+        batch = []
+        written = 0
+        for file_name, directory, file_size, ctime, mtime in videos:
+            if known.get((directory, file_name)) == (file_size, mtime):
+                continue
+            batch.append((file_name, directory, file_size, ctime, mtime))
+            if len(batch) >= batch_rows:
+                cursor.executemany(UPSERT_VIDEO_SQL, batch)
+                conn.commit()
+                written += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(UPSERT_VIDEO_SQL, batch)
+            conn.commit()
+            written += len(batch)
+        if verbose:
+            print(f"Movies added to the database successfully! {written} new or changed, {len(known)} already known.")
+        return written
+    except sqlite3.Error as e:
+        print(e)
+        return 0
+
+def insert_videos_row_by_row(conn, videos):
+    """Insert video files the way CineVault used to: one COUNT(*) lookup and one insert per video."""
+    cursor = conn.cursor()
+    for file_name, directory, file_size, ctime, mtime in videos:
+        cursor.execute("SELECT COUNT(*) FROM video WHERE file_name = ? AND directory = ?", (file_name, directory))
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("INSERT INTO video (file_name, directory, file_size, ctime, mtime) VALUES (?, ?, ?, ?, ?)",
+                           (file_name, directory, file_size, ctime, mtime))
+    conn.commit()
+
+def benchmark_ingestion(video_count=20000):
+    """Compare ingestion throughput of the row-by-row inserts and the batched upserts on synthetic videos."""
+    videos = [(f"movie_{i:07d}.mkv", os.path.join("library", f"folder_{i // 100:05d}"), i * 1000, i, i)
+              for i in range(video_count)]
+    base_dir = tempfile.mkdtemp(prefix="cinevault_benchmark_")
+    try:
+        print(f"{'Method':<14} {'Run':<10} {'Seconds':<10} {'Videos/sec':<12}")
+        print("-" * 46)
+        for method in ("row-by-row", "batched"):
+            conn = sqlite3.connect(os.path.join(base_dir, f"{method}.db"))
+            if method == "batched":
+                create_video_table(conn)
+            else:
+                conn.execute("CREATE TABLE video (id INTEGER PRIMARY KEY, file_name TEXT, directory TEXT, "
+                             "file_size INTEGER, ctime INTEGER, mtime INTEGER)")
+            # The first run fills an empty table, the second is a rescan where every video is known
+            for run in ("first", "rescan"):
+                start_time = time.perf_counter()
+                if method == "batched":
+                    insert_videos(conn, videos, verbose=False)
+                else:
+                    insert_videos_row_by_row(conn, videos)
+                elapsed = time.perf_counter() - start_time
+                print(f"{method:<14} {run:<10} {elapsed:<10.2f} {video_count / elapsed:<12.0f}")
+            conn.close()
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def import_cv2():
+    """Import OpenCV, which only metadata probing needs."""
+    try:
+        import cv2
+    except ImportError:
+        print("Probing video metadata needs OpenCV. Install it with: pip install opencv-python")
+        return None
+    return cv2
+
+def probe_video(file_path):
+    """Read duration, resolution, fps, codec and frame count from a video's container with OpenCV."""
+    cv2 = import_cv2()
+    video = cv2.VideoCapture(file_path)
+    try:
+        if not video.isOpened():
+            return None, "unable to open"
+        fps = video.get(cv2.CAP_PROP_FPS)
+        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        fourcc = int(video.get(cv2.CAP_PROP_FOURCC))
+        codec = "".join(chr((fourcc >> shift) & 0xFF) for shift in (0, 8, 16, 24)).strip("\0 ") or None
+        duration = frame_count / fps if fps > 0 and frame_count > 0 else None
+        return (duration, int(video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                fps or None, codec, frame_count or None), None
+    finally:
+        video.release()
+
+def phash_frame(cv2, frame):
+    """Compute the 64-bit DCT perceptual hash of a frame: one bit per low-frequency coefficient above the median."""
+    gray = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 32), interpolation=cv2.INTER_AREA)
+    coefficients = cv2.dct(gray.astype("float32"))[:8, :8].flatten().tolist()
+    median = sorted(coefficients[1:])[31]  # the DC term only reflects overall brightness
+    return sum(1 << bit for bit, coefficient in enumerate(coefficients) if coefficient > median)
+
+def hash_video(file_path):
+    """Hash PHASH_FRAMES frames at evenly spaced positions into one signature, so a re-encode or a renamed
+    copy gets a signature close to the original's. Frames are decoded by video_frame_extractor's
+    decode_frames, the same path thumbnails take, which seeks between frames that are far apart."""
+    cv2 = import_cv2()
+    from video_frame_extractor import decode_frames
+    video = cv2.VideoCapture(file_path)
+    try:
+        if not video.isOpened():
+            return None, "unable to open"
+        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count <= 0:
+            return None, "no frame count"
+        # The first and last positions are skipped, since fades to black look alike in every video
+        frame_numbers = [position * frame_count // (PHASH_FRAMES + 1) for position in range(1, PHASH_FRAMES + 1)]
+        frames = dict(decode_frames(video, frame_numbers))
+        if not all(frame_number in frames for frame_number in frame_numbers):
+            return None, "unable to read frames"
+        signature = 0
+        for frame_number in frame_numbers:
+            signature = signature << 64 | phash_frame(cv2, frames[frame_number])
+        return format(signature, f"0{PHASH_FRAMES * 16}x"), None
+    finally:
+        video.release()
+
+def hamming_distance(a, b):
+    """Count the bits that differ between two signatures."""
+    return bin(a ^ b).count("1")
+
+def split_signature(signature, frames):
+    """Split a video signature into its per-frame 64-bit hashes, first frame first."""
+    return tuple(signature >> (64 * (frames - 1 - frame)) & 0xFFFFFFFFFFFFFFFF for frame in range(frames))
+
+class MultiIndexHash:
+    """Multi-index hashing over tuples of 64-bit frame hashes. Each frame hash is cut into blocks and every
+    block is a key into its own table. When two hashes differ in at most radius bits, some block differs in at
+    most radius // blocks bits (pigeonhole), so a search only probes the keys that close to each query block
+    and verifies the videos found there, instead of comparing against every video."""
+
+    def __init__(self, frames, radius, expected_size):
+        self.radius = radius
+        # Blocks about log2(n) bits wide keep buckets near one entry. More than radius + 1 blocks cannot help,
+        # and fewer than (radius + 1) / 3 would leave a block radius above 2, which takes too many probes
+        blocks = round(64 / max(1, math.log2(max(2, expected_size))))
+        blocks = min(radius + 1, 64, max(blocks, math.ceil((radius + 1) / 3), 1))
+        self.block_radius = radius // blocks
+        widths = [64 // blocks + (1 if block < 64 % blocks else 0) for block in range(blocks)]
+        self.blocks = [(sum(widths[:block]), width) for block, width in enumerate(widths)]
+        # XOR masks turning a block key into every key within block_radius bits of it, built once per width
+        self.masks = {width: [sum(1 << bit for bit in bits) for flips in range(self.block_radius + 1)
+                              for bits in itertools.combinations(range(width), flips)] for width in set(widths)}
+        self.tables = [[{} for block in self.blocks] for frame in range(frames)]
+        self.signatures = {}
+
+    def add(self, frame_hashes, value):
+        for frame, frame_hash in enumerate(frame_hashes):
+            for table, (shift, width) in zip(self.tables[frame], self.blocks):
+                table.setdefault(frame_hash >> shift & (1 << width) - 1, []).append(value)
+        self.signatures[value] = frame_hashes
+
+    def search(self, frame_hashes):
+        """Yield (distances, value) for every value whose frame hashes each lie within radius bits of the
+        query's. A match must be close on every frame, so only the candidates of the frame with the smallest
+        buckets are verified."""
+        best = None
+        for frame, frame_hash in enumerate(frame_hashes):
+            buckets = []
+            for table, (shift, width) in zip(self.tables[frame], self.blocks):
+                key = frame_hash >> shift & (1 << width) - 1
+                buckets.extend(table[key ^ mask] for mask in self.masks[width] if key ^ mask in table)
+            size = sum(len(bucket) for bucket in buckets)
+            if best is None or size < best[0]:
+                best = (size, buckets)
+        seen = set()
+        for bucket in best[1] if best else ():
+            for value in bucket:
+                if value in seen:
+                    continue
+                seen.add(value)
+                # Most candidates differ too much on the first frame compared, so stop at the first miss
+                distances = []
+                for a, b in zip(frame_hashes, self.signatures[value]):
+                    distances.append(hamming_distance(a, b))
+                    if distances[-1] > self.radius:
+                        break
+                else:
+                    yield distances, value
+
+def probe_files(file_paths, workers=PROBE_WORKERS, timeout=PROBE_TIMEOUT, probe=probe_video):
+    """Run probe on files in a process pool, yielding (path, result, error). A file that takes longer than
+    timeout seconds is reported as timed out and the pool is restarted to get rid of the stuck worker."""
+    pending = list(reversed(file_paths))
+    done = queue.Queue()
+    while pending:
+        pool = multiprocessing.Pool(workers)
+        in_flight = {}
+        try:
+            while pending or in_flight:
+                # Only as many files as workers are submitted, so each deadline starts when its probe does
+                while pending and len(in_flight) < workers:
+                    file_path = pending.pop()
+                    in_flight[file_path] = time.monotonic() + timeout
+                    pool.apply_async(probe, (file_path,),
+                                     callback=lambda result, path=file_path: done.put((path, result)),
+                                     error_callback=lambda error, path=file_path: done.put((path, (None, str(error)))))
+                try:
+                    file_path, (metadata, error) = done.get(timeout=max(0, min(in_flight.values()) - time.monotonic()))
+                except queue.Empty:
+                    file_path = min(in_flight, key=in_flight.get)
+                    del in_flight[file_path]
+                    yield file_path, None, "timed out"
+                    # The other files in flight are probed again by the next pool
+                    pending.extend(in_flight)
+                    break
+                if in_flight.pop(file_path, None) is not None:
+                    yield file_path, metadata, error
+        finally:
+            pool.terminate()
+            pool.join()
+
+def probe_new_videos(conn, workers=PROBE_WORKERS, timeout=PROBE_TIMEOUT):
+    """Probe videos added or changed since they were last probed and store their metadata."""
+    if import_cv2() is None:
+        return
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, directory, file_name, file_size, mtime FROM video
+            WHERE probe_size IS NOT file_size OR probe_mtime IS NOT mtime
+        """)
+        videos = {os.path.join(directory, file_name): (video_id, file_size, mtime)
+                  for video_id, directory, file_name, file_size, mtime in cursor.fetchall()}
+        if not videos:
+            print("All videos are already probed.")
+            return
+        print(f"Probing {len(videos)} videos with {workers} processes...")
+        updates = []
+        failed = 0
+        for file_path, metadata, error in probe_files(list(videos), workers, timeout):
+            video_id, file_size, mtime = videos[file_path]
+            if error:
+                print(f"{file_path}: {error}")
+                failed += 1
+            updates.append((metadata or (None,) * 6) + (file_size, mtime, error, video_id))
+            if len(updates) >= INSERT_BATCH_ROWS:
+                cursor.executemany(PROBE_UPDATE_SQL, updates)
+                conn.commit()
+                updates = []
+        cursor.executemany(PROBE_UPDATE_SQL, updates)
         conn.commit()
+        print(f"Probed {len(videos) - failed} videos, {failed} failed.")
     except sqlite3.Error as e:
         print(e)
 
-def insert_videos(conn, videos):
-    """Insert video files into the database."""
+def hash_new_videos(conn, workers=PROBE_WORKERS, timeout=PROBE_TIMEOUT):
+    """Compute perceptual hashes for videos added or changed since they were last hashed."""
+    if import_cv2() is None:
+        return False
     try:
         cursor = conn.cursor()
-        for video in videos:
-            file_name, directory, file_size_mb = video
-            cursor.execute("SELECT COUNT(*) FROM video WHERE file_name = ? AND directory = ?", (file_name, directory))
-            count = cursor.fetchone()[0]
-            if count == 0:
-                cursor.execute("INSERT INTO video (file_name, directory, file_size_mb) VALUES (?, ?, ?)", (file_name, directory, file_size_mb))
+        cursor.execute("""
+            SELECT id, directory, file_name, file_size, mtime FROM video
+            WHERE phash_size IS NOT file_size OR phash_mtime IS NOT mtime
+        """)
+        videos = {os.path.join(directory, file_name): (video_id, file_size, mtime)
+                  for video_id, directory, file_name, file_size, mtime in cursor.fetchall()}
+        if videos:
+            print(f"Hashing {len(videos)} videos with {workers} processes...")
+        updates = []
+        for file_path, signature, error in probe_files(list(videos), workers, timeout, hash_video):
+            video_id, file_size, mtime = videos[file_path]
+            if error:
+                print(f"{file_path}: {error}")
+            updates.append((signature, file_size, mtime, video_id))
+            if len(updates) >= INSERT_BATCH_ROWS:
+                cursor.executemany("UPDATE video SET phash=?, phash_size=?, phash_mtime=? WHERE id=?", updates)
+                conn.commit()
+                updates = []
+        cursor.executemany("UPDATE video SET phash=?, phash_size=?, phash_mtime=? WHERE id=?", updates)
         conn.commit()
-        print("Movies added to the database successfully!")
+        return True
     except sqlite3.Error as e:
         print(e)
+        return False
 
-def export_database(conn, output_file):
-    """Export the database to a .txt file."""
+def find_near_duplicates(conn, max_distance=PHASH_DISTANCE):
+    """Group videos whose signatures differ in at most max_distance bits per sampled frame. Each video is
+    looked up in a multi-index hash of the videos before it, so candidates are found without comparing all pairs."""
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM video")
-        with open(output_file, 'w') as f:
-            for row in cursor.fetchall():
-                f.write(f"{row[0]} | {row[1]} | {row[3]} | {row[2]}\n")
-        print(f"Database exported to {output_file} successfully!")
+        cursor.execute("SELECT id, phash FROM video WHERE phash IS NOT NULL ORDER BY id")
+        # Signatures written with another PHASH_FRAMES setting cannot be compared frame by frame
+        videos = {video_id: split_signature(int(phash, 16), PHASH_FRAMES)
+                  for video_id, phash in cursor.fetchall() if len(phash) == PHASH_FRAMES * 16}
     except sqlite3.Error as e:
         print(e)
+        return []
+    index = MultiIndexHash(PHASH_FRAMES, max_distance, len(videos))
+    group_of = {}
+    groups = {}
+    for video_id, frame_hashes in videos.items():
+        for distances, match_id in index.search(frame_hashes):
+            # Merge the match's group into this video's group
+            group = group_of.get(video_id, video_id)
+            other = group_of.get(match_id, match_id)
+            if group != other:
+                members = groups.pop(other, {other})
+                groups.setdefault(group, {group}).update(members)
+                for member in members:
+                    group_of[member] = group
+                group_of[video_id] = group
+        index.add(frame_hashes, video_id)
+    return [sorted(members) for members in groups.values()]
 
-def check_similar_records(conn):
-    """Check for similar records based on movie name."""
+def search_videos(conn, min_duration=None, max_duration=None, min_height=None, codec=None):
+    """Find videos by duration in seconds, minimum vertical resolution and codec."""
+    conditions, parameters = [], []
+    if min_duration is not None:
+        conditions.append("duration >= ?")
+        parameters.append(min_duration)
+    if max_duration is not None:
+        conditions.append("duration <= ?")
+        parameters.append(max_duration)
+    if min_height is not None:
+        conditions.append("height >= ?")
+        parameters.append(min_height)
+    if codec:
+        conditions.append("LOWER(codec) = LOWER(?)")
+        parameters.append(codec)
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT file_name, COUNT(*) FROM video GROUP BY file_name HAVING COUNT(*) > 1")
-        similar_records = cursor.fetchall()
-        if similar_records:
-            print("Similar records found:")
-            for record in similar_records:
-                print(record[0])  # Print movie name
+        cursor.execute(f"""
+            SELECT file_name, directory, duration, width, height, fps, codec FROM video
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY directory, file_name
+        """, parameters)
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(e)
+        return []
+
+def fetch_batches(cursor, batch_rows=EXPORT_BATCH_ROWS):
+    """Yield rows from a cursor in batches, so exports never hold the whole table in memory."""
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+        yield rows
+
+def export_columnar(cursor, output_file, columnar_format):
+    """Write the video table to Parquet or Arrow IPC one record batch at a time."""
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        print("Exporting to .parquet or .arrow needs pyarrow. Install it with: pip install pyarrow")
+        return False
+    schema = pa.schema([("id", pa.int64()), ("file_name", pa.string()), ("directory", pa.string()),
+                        ("file_size", pa.int64()), ("ctime", pa.int64()), ("mtime", pa.int64()),
+                        ("duration", pa.float64()), ("width", pa.int64()), ("height", pa.int64()),
+                        ("fps", pa.float64()), ("codec", pa.string()), ("frame_count", pa.int64())])
+    if columnar_format == "parquet":
+        writer = pa.parquet.ParquetWriter(output_file, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(output_file, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+    with writer:
+        for rows in fetch_batches(cursor):
+            columns = list(zip(*rows))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+    return True
+
+def export_database(conn, output_file):
+    """Export the database to .txt, .csv, .jsonl, .parquet or .arrow, chosen by the file extension."""
+    try:
+        cursor = conn.cursor()
+        compressed = output_file.endswith(".gz")
+        extension = os.path.splitext(output_file[:-3] if compressed else output_file)[-1].lower()
+        if extension in (".parquet", ".arrow"):
+            cursor.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM video")
+            if not export_columnar(cursor, output_file, extension[1:]):
+                return
         else:
-            print("No similar records found.")
+            newline = "" if extension == ".csv" else None  # the csv module writes its own line endings
+            f = gzip.open(output_file, "wt", encoding="utf-8", newline=newline) if compressed else open(output_file, "w", newline=newline)
+            with f:
+                if extension in (".csv", ".jsonl"):
+                    cursor.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM video")
+                    if extension == ".csv":
+                        writer = csv.writer(f)
+                        writer.writerow(EXPORT_COLUMNS)
+                        for rows in fetch_batches(cursor):
+                            writer.writerows(rows)
+                    else:
+                        for rows in fetch_batches(cursor):
+                            f.write("".join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in rows))
+                else:
+                    cursor.execute("SELECT id, file_name, directory, file_size_mb FROM video_view")
+                    for rows in fetch_batches(cursor):
+                        f.write("".join(f"{row[0]} | {row[1]} | {row[3]} | {row[2]}\n" for row in rows))
+        print(f"Database exported to {output_file} successfully!")
     except sqlite3.Error as e:
         print(e)
 
+def check_similar_records(conn, max_distance=PHASH_DISTANCE):
+    """Check for re-encodes and renamed copies by comparing perceptual hashes of sampled frames."""
+    if not hash_new_videos(conn):
+        return
+    groups = find_near_duplicates(conn, max_distance)
+    if groups:
+        print("Similar records found:")
+        cursor = conn.cursor()
+        for members in groups:
+            print()
+            for video_id in members:
+                cursor.execute("SELECT file_name, directory, file_size FROM video WHERE id = ?", (video_id,))
+                file_name, directory, file_size = cursor.fetchone()
+                print(f"{file_name} | {file_size / 1048576:.0f} MB | {directory}")
+    else:
+        print("No similar records found.")
+
 def main():
     print("Welcome to CineVault Video Database Management!")
     while True:
@@ -97,9 +558,11 @@ def main():
         print("1. Scan directory for video files and create database")
         print("2. Add a single movie to the database")
         print("3. Update database with new movie files")
-        print("4. Export database to a text file")
-        print("5. Check for similar records based on movie name")
-        print("6. Exit")
+        print("4. Export database to a file (.txt, .csv, .jsonl, .parquet, .arrow)")
+        print("5. Check for near-duplicate videos (re-encodes and renamed copies)")
+        print("6. Search videos by duration, resolution or codec")
+        print("7. Benchmark ingestion throughput")
+        print("8. Exit")
 
         choice = input("Enter your choice: ")
 
@@ -114,6 +577,8 @@ def main():
                 create_video_table(conn)
                 videos = list_video_files(directory, include_subfolders)
                 insert_videos(conn, videos)
+                if input("Probe video metadata (duration, resolution, codec)? (yes/no): ").lower() == "yes":
+                    probe_new_videos(conn)
                 conn.close()
                 print("Video files listed successfully!")
                 input("Press Enter to return to the main menu...")
@@ -145,6 +610,8 @@ def main():
                 create_video_table(conn)
                 videos = list_video_files(directory, include_subfolders=True)
                 insert_videos(conn, videos)
+                if input("Probe video metadata (duration, resolution, codec)? (yes/no): ").lower() == "yes":
+                    probe_new_videos(conn)
                 conn.close()
                 print("Database updated successfully!")
                 input("Press Enter to return to the main menu...")
@@ -153,10 +620,11 @@ def main():
 
         elif choice == "4":
             database_file = input("Enter the database address that should be exported: ")
-            output_file = input("Enter the name of the output .txt file: ")
+            output_file = input("Enter the name of the output file (.txt, .csv, .jsonl, .parquet or .arrow; add .gz to compress text): ")
             db_file_path = os.path.join(os.getcwd(), database_file)
             conn = create_connection(db_file_path)
             if conn is not None:
+                create_video_table(conn)
                 export_database(conn, output_file)
                 conn.close()
                 input("Press Enter to return to the main menu...")
@@ -168,6 +636,7 @@ def main():
             db_file_path = os.path.join(os.getcwd(), db_file)
             conn = create_connection(db_file_path)
             if conn is not None:
+                create_video_table(conn)
                 check_similar_records(conn)
                 conn.close()
                 input("Press Enter to return to the main menu...")
@@ -175,6 +644,38 @@ def main():
                 print("Error: Unable to create or connect to the database.")
 
         elif choice == "6":
+            db_file = input("Enter the path of the database file: ")
+            db_file_path = os.path.join(os.getcwd(), db_file)
+            conn = create_connection(db_file_path)
+            if conn is not None:
+                create_video_table(conn)
+                min_minutes = input("Minimum duration in minutes (blank for any): ")
+                max_minutes = input("Maximum duration in minutes (blank for any): ")
+                min_height = input("Minimum vertical resolution, e.g. 1080 (blank for any): ")
+                codec = input("Codec FourCC, e.g. h264 or hevc (blank for any): ").strip()
+                try:
+                    videos = search_videos(conn, float(min_minutes) * 60 if min_minutes else None,
+                                           float(max_minutes) * 60 if max_minutes else None,
+                                           int(min_height) if min_height else None, codec)
+                except ValueError:
+                    print("Invalid number.")
+                    videos = []
+                for file_name, directory, duration, width, height, fps, video_codec in videos:
+                    length = f"{duration / 60:.1f} min" if duration else "? min"
+                    rate = f"{fps:.2f} fps" if fps else "? fps"
+                    print(f"{file_name} | {length} | {width}x{height} | {rate} | {video_codec} | {directory}")
+                print(f"{len(videos)} videos found.")
+                conn.close()
+                input("Press Enter to return to the main menu...")
+            else:
+                print("Error: Unable to create or connect to the database.")
+
+        elif choice == "7":
+            video_count = input("Number of synthetic videos (default 20000): ")
+            benchmark_ingestion(int(video_count) if video_count.isdigit() and int(video_count) > 0 else 20000)
+            input("Press Enter to return to the main menu...")
+
+        elif choice == "8":
             print("Exiting the program...")
             break
 
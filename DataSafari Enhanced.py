@@ -3,44 +3,169 @@ import psutil
 import sqlite3
 from datetime import datetime
 from tqdm import tqdm
+import queue
+import shutil
+import tempfile
+import threading
+import time
 import concurrent.futures
 
-# Function to create the 'files' table in the database
-def create_files_table(conn):
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS files (
-                    id INTEGER PRIMARY KEY,
-                    type TEXT,
-                    file_format TEXT,
-                    name TEXT,
-                    address TEXT,
-                    size INTEGER,
-                    created_date TEXT
-                )''')
-    conn.commit()
+from scan_common import (rebuild_dir_stats, create_files_table, begin_bulk_load, end_bulk_load,
+                         prompt_filter_rules, compile_filter, dir_allowed, list_directory,
+                         subtree_bounds, reconcile_directory, format_size, DEFAULT_FILTER_RULES)
 
-# Function to insert files into the database
-def insert_files(conn, files):
-    c = conn.cursor()
-    c.executemany("INSERT INTO files (type, file_format, name, address, size, created_date) VALUES (?, ?, ?, ?, ?, ?)", files)
-    conn.commit()
+# Pipeline sizing for search_hard_drives: listing threads, stat threads and the depth, in folder
+# listings, of the queues between them. Memory use is bounded by the queue depth, not by the size of the drive.
+WALK_WORKERS = 4
+STAT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+QUEUE_SIZE = 256
+DEFAULT_BATCH_SIZE = 5000
+
+# Parallel update sizing: a work unit stops after listing this many entries and hands the rest of
+# its subtree back to be split across the process pool
+UNIT_ENTRIES = 20000
+DEFAULT_WORKERS = os.cpu_count() or 1
 
-# Function to insert directories into the database
-def insert_directories(conn, directories):
+# Function to estimate how many files a drive holds from the previous scan stored in the database
+def previous_file_count(conn, drive_path):
+    low, high = subtree_bounds(os.path.normpath(drive_path))
+    count = conn.execute("SELECT COUNT(*) FROM files WHERE type='file' AND deleted=0 AND address>=? AND address<?",
+                         (low, high)).fetchone()[0]
+    return count or None
+
+# Function to put an item on a bounded queue, giving up once the pipeline is stopped
+def put_unless_stopped(q, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+# Function to list directories from the work queue, queueing subfolders and passing each complete
+# listing on to be stat'ed
+def walk_worker(dir_queue, entry_queue, stop_event):
+    while True:
+        item = dir_queue.get()
+        try:
+            if item is None:
+                return
+            if stop_event.is_set():
+                continue
+            dir_path, dir_mtime = item
+            if dir_mtime is None:
+                dir_mtime = os.stat(dir_path).st_mtime_ns
+            listing = []
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if is_dir:
+                            # The stat result is cached on the entry, so the stat worker reuses it
+                            try:
+                                sub_mtime = entry.stat().st_mtime_ns
+                            except OSError:
+                                sub_mtime = None
+                            dir_queue.put((entry.path, sub_mtime))
+                        listing.append((entry, is_dir))
+                    except OSError:
+                        pass  # Ignore error and continue
+            # Only whole listings go on, since the writer soft-deletes whatever a listing leaves out
+            put_unless_stopped(entry_queue, (dir_path, dir_mtime, listing), stop_event)
+        except OSError:
+            pass  # Ignore error and continue
+        finally:
+            dir_queue.task_done()
+
+# Function to stat the entries of queued listings, in the (name, path, is_dir, stat) form of list_directory
+def stat_worker(entry_queue, listing_queue, stop_event):
+    while True:
+        item = entry_queue.get()
+        if item is None or stop_event.is_set():
+            return
+        dir_path, dir_mtime, listing = item
+        entries = []
+        for entry, is_dir in listing:
+            try:
+                entries.append((entry.name, entry.path, is_dir, entry.stat()))
+            except OSError:
+                pass  # Ignore error and continue
+        if not put_unless_stopped(listing_queue, (dir_path, dir_mtime, entries), stop_event):
+            return
+
+# Function to reconcile listings from the queue against the database, committing in batches so
+# everything written so far survives an interruption. Rows a listing no longer holds are marked deleted,
+# and a folder is recorded in scanned_dirs only by the reconcile of its complete listing.
+def write_worker(db_name, listing_queue, include_subfolders, batch_size, progress_bar, totals, bulk_load):
+    conn = sqlite3.connect(db_name)
+    if bulk_load:
+        begin_bulk_load(conn)
     c = conn.cursor()
-    c.executemany("INSERT INTO files (type, name, address, created_date) VALUES (?, ?, ?, ?)", directories)
+    pending_entries = 0
+    pending_files = 0
+    while True:
+        item = listing_queue.get()
+        if item is not None:
+            dir_path, dir_mtime, entries = item
+            subdirs, changed = reconcile_directory(c, dir_path, dir_mtime, entries, include_subfolders,
+                                                   update_dir_stats=False)
+            file_sizes = [st.st_size for name, path, is_dir, st in entries if not is_dir]
+            totals['files'] += len(file_sizes)
+            totals['bytes'] += sum(file_sizes)
+            totals['changed'] += changed
+            pending_entries += len(entries) + 1
+            pending_files += len(file_sizes)
+        if pending_entries and (item is None or pending_entries >= batch_size):
+            conn.commit()
+            progress_bar.update(pending_files)
+            progress_bar.set_postfix_str(f"{format_size(totals['bytes'])} seen", refresh=False)
+            pending_entries = pending_files = 0
+        if item is None:
+            break
+    # With every listing reconciled, the folder totals are computed in one bottom-up pass
+    rebuild_dir_stats(c)
     conn.commit()
+    if bulk_load:
+        end_bulk_load(conn)
+    conn.close()
 
-# Function to process a single file
-def process_file(file_path):
-    file_format = os.path.splitext(os.path.basename(file_path))[-1].lower()
-    size = int(os.path.getsize(file_path) / 1024)
-    created_date = None
+# Function to stream a drive into the database: walker threads list folders, stat threads stat their
+# entries and a single writer thread reconciles each listing and commits in batches
+def scan_drive(db_name, drive_path, include_subfolders, batch_size, progress_bar, bulk_load=False):
+    dir_queue = queue.Queue()
+    entry_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    listing_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    stop_event = threading.Event()
+    totals = {'files': 0, 'bytes': 0, 'changed': 0}
+    walkers = [threading.Thread(target=walk_worker, args=(dir_queue, entry_queue, stop_event), daemon=True)
+               for _ in range(WALK_WORKERS)]
+    stat_workers = [threading.Thread(target=stat_worker, args=(entry_queue, listing_queue, stop_event), daemon=True)
+                    for _ in range(STAT_WORKERS)]
+    writer = threading.Thread(target=write_worker, args=(db_name, listing_queue, include_subfolders, batch_size,
+                                                         progress_bar, totals, bulk_load))
+    for thread in walkers + stat_workers + [writer]:
+        thread.start()
+    dir_queue.put((os.path.normpath(drive_path), None))
+    interrupted = False
     try:
-        created_date = datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
-    except OSError as e:
-        pass  # Ignore error and continue
-    return ('file', file_format, os.path.basename(file_path), file_path, size, created_date)
+        # Wait in a helper thread so Ctrl+C still reaches the main thread
+        listing_done = threading.Thread(target=dir_queue.join, daemon=True)
+        listing_done.start()
+        while listing_done.is_alive():
+            listing_done.join(0.2)
+        for _ in walkers:
+            dir_queue.put(None)
+        for _ in stat_workers:
+            entry_queue.put(None)
+        for thread in stat_workers:
+            thread.join()
+    except KeyboardInterrupt:
+        interrupted = True
+        stop_event.set()
+    listing_queue.put(None)
+    writer.join()
+    return totals, interrupted
 
 # Function to search hard drives completely and record everything
 def search_hard_drives():
@@ -69,38 +194,141 @@ def search_hard_drives():
     conn = sqlite3.connect(db_name)
     create_files_table(conn)
     
+    batch_size = input(f"Rows per database commit (default {DEFAULT_BATCH_SIZE}): ")
+    batch_size = int(batch_size) if batch_size.isdigit() and int(batch_size) > 0 else DEFAULT_BATCH_SIZE
+    bulk_load = input("Use bulk-load mode (faster, but a crash can corrupt the database)? (yes/no): ").lower() == 'yes'
+    
+    # Walk the drive once; a previous scan in this database, if any, provides the progress total
     print(f"Scanning drive: {drive_path}")
-    total_files = 0
-    for root, dirs, files in os.walk(drive_path):
-        total_files += len(files)
-    progress_bar = tqdm(total=total_files, desc="Processing files", unit="file")
+    progress_bar = tqdm(total=previous_file_count(conn, drive_path), desc="Processing files", unit="file")
+    conn.close()
     start_time = datetime.now()
-    processed_files = []
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(process_file, os.path.join(root, name)) for root, dirs, files in os.walk(drive_path) for name in files]
-        for future in concurrent.futures.as_completed(futures):
-            processed_files.append(future.result())
-            progress_bar.update(1)
+    totals, interrupted = scan_drive(db_name, drive_path, include_subfolders, batch_size, progress_bar, bulk_load)
     progress_bar.close()
-    insert_files(conn, processed_files)
+    if interrupted:
+        print(f"Scan interrupted. {totals['files']} files scanned so far were saved to '{db_name}'.")
+        return
     end_time = datetime.now()
     time_elapsed = (end_time - start_time).total_seconds()
     print(f"Search completed and data recorded successfully. Database '{db_name}' created.")
+    print(f"Files recorded: {totals['files']} ({format_size(totals['bytes'])}).")
     print(f"Time elapsed: {time_elapsed:.2f} seconds.")
-    conn.close()
 
-# Function to update the database for a single drive
-def update_database_for_drive(drive_path, exclude_types, exclude_dirs):
-    processed_files = []
-    for root, dirs, files in os.walk(drive_path):
-        for name in files:
-            file_path = os.path.join(root, name)
-            if os.path.splitext(name)[-1].lower() in exclude_types:
-                continue
-            if any(excluded_dir in file_path for excluded_dir in exclude_dirs):
+# Connection each worker process uses, for reads only, to look up folder mtimes from the last scan
+worker_conn = None
+# Filter each worker process compiles once from the rules it is started with
+worker_filter = None
+
+# Function to open the worker's database connection and compile its filter when a process pool worker starts
+def open_worker_database(db_path, filter_rules=()):
+    global worker_conn, worker_filter
+    worker_conn = sqlite3.connect(db_path, timeout=60)
+    worker_filter = compile_filter(filter_rules)
+
+# Function to traverse part of a drive in a worker process. Folders whose mtime is unchanged are
+# descended through without listing them. Once max_entries entries have been listed, the unvisited
+# folders are returned so the parent process can hand them out to idle workers.
+def traverse_unit(dir_path, dir_mtime, verify_unchanged, max_entries=UNIT_ENTRIES):
+    c = worker_conn.cursor()
+    listings = []
+    skipped = 0
+    listed_entries = 0
+    stack = [(dir_path, dir_mtime)]
+    while stack:
+        dir_path, dir_mtime = stack.pop()
+        if dir_mtime is None:
+            try:
+                dir_mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
                 continue
-            processed_files.append(process_file(file_path))
-    return processed_files
+        c.execute("SELECT mtime FROM scanned_dirs WHERE address=?", (dir_path,))
+        row = c.fetchone()
+        if row and row[0] == dir_mtime and not verify_unchanged:
+            c.execute("SELECT address FROM scanned_dirs WHERE parent=?", (dir_path,))
+            stack.extend((sub, None) for (sub,) in c.fetchall() if dir_allowed(worker_filter, os.path.basename(sub)))
+            skipped += 1
+        else:
+            entries = list_directory(dir_path, worker_filter)
+            listings.append((dir_path, dir_mtime, entries))
+            stack.extend((path, st.st_mtime_ns) for name, path, is_dir, st in entries if is_dir)
+            listed_entries += len(entries)
+        # Skipped folders count towards the budget too, so unchanged trees still get split up
+        if listed_entries + skipped >= max_entries:
+            break
+    return listings, skipped, stack
+
+# Function to update the database for several drives at once. Worker processes list folders
+# while this process reconciles their listings through the single SQLite connection.
+def update_database_for_drives(conn, db_path, drive_paths, include_subfolders, filter_rules,
+                               verify_unchanged, workers, progress_bar=None):
+    conn.commit()  # Workers read scanned_dirs through their own connections
+    c = conn.cursor()
+    stats = {'listed': 0, 'skipped': 0, 'changed': 0, 'files': 0, 'bytes': 0}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=open_worker_database,
+                                                initargs=(db_path, filter_rules)) as executor:
+        def submit(dir_path, dir_mtime, max_entries=UNIT_ENTRIES):
+            return executor.submit(traverse_unit, dir_path, dir_mtime, verify_unchanged, max_entries)
+        # Each drive root is listed on its own so that its top-level folders become the first work units
+        pending = {submit(os.path.normpath(drive_path), None, 0) for drive_path in drive_paths}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                listings, skipped, frontier = future.result()
+                pending.update(submit(dir_path, dir_mtime) for dir_path, dir_mtime in frontier)
+                for dir_path, dir_mtime, entries in listings:
+                    subdirs, changed = reconcile_directory(c, dir_path, dir_mtime, entries, include_subfolders)
+                    file_sizes = [st.st_size for name, path, is_dir, st in entries if not is_dir]
+                    stats['listed'] += 1
+                    stats['changed'] += changed
+                    stats['files'] += len(file_sizes)
+                    stats['bytes'] += sum(file_sizes)
+                    if progress_bar is not None:
+                        progress_bar.update(len(file_sizes))
+                stats['skipped'] += skipped
+                # Short transactions keep the workers' reads from waiting on this writer
+                conn.commit()
+                if progress_bar is not None:
+                    progress_bar.set_postfix_str(f"{format_size(stats['bytes'])} seen, {stats['skipped']} unchanged folders skipped",
+                                                 refresh=False)
+    return stats
+
+# Function to create a synthetic tree of empty files for the traversal benchmark
+def build_synthetic_tree(base_dir, file_count, files_per_dir=1000, dirs_per_branch=10):
+    dir_count = max(1, file_count // files_per_dir)
+    for i in range(dir_count):
+        dir_path = os.path.join(base_dir, f"branch_{i // dirs_per_branch:05d}", f"leaf_{i:06d}")
+        os.makedirs(dir_path)
+        for j in range(min(files_per_dir, file_count - i * files_per_dir)):
+            open(os.path.join(dir_path, f"file_{j:04d}.dat"), 'wb').close()
+
+# Function to measure how the parallel update scales from 1 to N worker processes
+def benchmark_traversal():
+    file_count = input("Number of files in the synthetic tree (default 1000000): ")
+    file_count = int(file_count) if file_count.isdigit() and int(file_count) > 0 else 1000000
+    max_workers = input(f"Highest worker count to test (default {DEFAULT_WORKERS}): ")
+    max_workers = int(max_workers) if max_workers.isdigit() and int(max_workers) > 0 else DEFAULT_WORKERS
+    worker_counts = sorted({min(2 ** i, max_workers) for i in range(max_workers.bit_length() + 1)})
+    
+    base_dir = tempfile.mkdtemp(prefix="datasafari_benchmark_")
+    try:
+        tree_dir = os.path.join(base_dir, "tree")
+        print(f"Creating {file_count} files in {tree_dir}...")
+        build_synthetic_tree(tree_dir, file_count)
+        print(f"{'Workers':<10} {'Seconds':<10} {'Files/sec':<12} {'Speedup':<8}")
+        print("-" * 42)
+        baseline = None
+        for workers in worker_counts:
+            db_path = os.path.join(base_dir, f"benchmark_{workers}.db")
+            conn = sqlite3.connect(db_path)
+            create_files_table(conn)
+            start_time = time.perf_counter()
+            stats = update_database_for_drives(conn, db_path, [tree_dir], False, [], True, workers)
+            elapsed = time.perf_counter() - start_time
+            conn.close()
+            baseline = baseline or elapsed
+            print(f"{workers:<10} {elapsed:<10.2f} {stats['files'] / elapsed:<12.0f} {baseline / elapsed:.2f}x")
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
 
 # Function to update an existing database
 def update_database():
@@ -123,24 +351,25 @@ def update_database():
             print("Invalid choice. Please enter valid numbers.")
     
     include_subfolders = input("Include subfolders? (yes/no): ").lower() == 'yes'
+    verify_unchanged = input("Re-check files in unchanged folders? (yes/no): ").lower() == 'yes'
+    workers = input(f"Number of worker processes (default {DEFAULT_WORKERS}): ")
+    workers = int(workers) if workers.isdigit() and int(workers) > 0 else DEFAULT_WORKERS
+    filter_rules = prompt_filter_rules(DEFAULT_FILTER_RULES)
     
     conn = sqlite3.connect(db_path)
     create_files_table(conn)
     
-    total_files = sum(len(os.listdir(partitions[choice - 1].mountpoint)) for choice in drive_numbers)
-    progress_bar = tqdm(total=total_files, desc="Updating database", unit="file")
+    # Only folders whose mtime changed since the last scan are listed again
+    progress_bar = tqdm(desc="Updating database", unit="file")
     start_time = datetime.now()
-    processed_files = []
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(update_database_for_drive, partitions[choice - 1].mountpoint, excluded_file_types, excluded_directories) for choice in drive_numbers]
-        for future in concurrent.futures.as_completed(futures):
-            processed_files.extend(future.result())
-            progress_bar.update(len(future.result()))
+    drive_paths = [partitions[choice - 1].mountpoint for choice in drive_numbers]
+    totals = update_database_for_drives(conn, db_path, drive_paths, include_subfolders, filter_rules,
+                                        verify_unchanged, workers, progress_bar)
     progress_bar.close()
-    insert_files(conn, processed_files)
     end_time = datetime.now()
     time_elapsed = (end_time - start_time).total_seconds()
     print(f"Database '{db_path}' updated successfully.")
+    print(f"Folders rescanned: {totals['listed']}, unchanged folders skipped: {totals['skipped']}, rows changed: {totals['changed']}.")
     print(f"Time elapsed: {time_elapsed:.2f} seconds.")
     conn.close()
 
@@ -150,17 +379,20 @@ def main():
         print("\nMENU:")
         print("1. Search Hard Drives")
         print("2. Update Existing Database")
-        print("3. Exit")
-        choice = input("Enter your choice (1-3): ")
+        print("3. Benchmark Parallel Traversal")
+        print("4. Exit")
+        choice = input("Enter your choice (1-4): ")
         if choice == '1':
             search_hard_drives()
         elif choice == '2':
             update_database()
         elif choice == '3':
+            benchmark_traversal()
+        elif choice == '4':
             print("Exiting the program.")
             break
         else:
-            print("Invalid choice. Please enter a number from 1 to 3.")
+            print("Invalid choice. Please enter a number from 1 to 4.")
 
 if __name__ == "__main__":
     main()
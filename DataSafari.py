@@ -1,22 +1,62 @@
 import os
+import mmap
+import hashlib
 import psutil
 import sqlite3
+import concurrent.futures
+from collections import defaultdict
 from datetime import datetime
 from tqdm import tqdm
 
-# Function to create the 'files' table in the database
-def create_files_table(conn):
+from scan_common import (rebuild_dir_stats, create_files_table, begin_bulk_load, end_bulk_load,
+                         prompt_filter_rules, compile_filter, dir_allowed, list_directory,
+                         subtree_bounds, reconcile_directory, format_size, DEFAULT_FILTER_RULES)
+
+# Function to estimate how many files a drive holds from the previous scan stored in the database
+def previous_file_count(conn, drive_path):
+    low, high = subtree_bounds(os.path.normpath(drive_path))
+    count = conn.execute("SELECT COUNT(*) FROM files WHERE type='file' AND deleted=0 AND address>=? AND address<?",
+                         (low, high)).fetchone()[0]
+    return count or None
+
+# Function to rescan a drive, only touching directories whose mtime changed since the last scan
+def incremental_update(conn, drive_path, include_subfolders, file_filter=None,
+                       verify_unchanged=False, progress_bar=None, update_dir_stats=True):
+    # A directory's mtime changes whenever an entry is added, removed or renamed in it, but not when
+    # an existing file is rewritten in place. verify_unchanged re-stats files in unchanged folders too.
+    # update_dir_stats=False leaves the folder totals to a rebuild_dir_stats call once the scan is done.
     c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS files (
-                    id INTEGER PRIMARY KEY,
-                    type TEXT,
-                    file_format TEXT,
-                    name TEXT,
-                    address TEXT,
-                    size INTEGER,
-                    created_date TEXT
-                )''')
+    stats = {'listed': 0, 'skipped': 0, 'changed': 0, 'files': 0, 'bytes': 0}
+    # Subfolders carry the mtime from their parent's listing, so only the root needs its own stat call
+    stack = [(os.path.normpath(drive_path), None)]
+    while stack:
+        dir_path, dir_mtime = stack.pop()
+        if dir_mtime is None:
+            try:
+                dir_mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+        c.execute("SELECT mtime FROM scanned_dirs WHERE address=?", (dir_path,))
+        row = c.fetchone()
+        if row and row[0] == dir_mtime and not verify_unchanged:
+            c.execute("SELECT address FROM scanned_dirs WHERE parent=?", (dir_path,))
+            stack.extend((sub, None) for (sub,) in c.fetchall() if dir_allowed(file_filter, os.path.basename(sub)))
+            stats['skipped'] += 1
+            continue
+        entries = list_directory(dir_path, file_filter)
+        subdirs, changed = reconcile_directory(c, dir_path, dir_mtime, entries, include_subfolders, update_dir_stats)
+        stack.extend(subdirs)
+        file_sizes = [st.st_size for name, path, is_dir, st in entries if not is_dir]
+        stats['listed'] += 1
+        stats['changed'] += changed
+        stats['files'] += len(file_sizes)
+        stats['bytes'] += sum(file_sizes)
+        if progress_bar is not None:
+            progress_bar.update(len(file_sizes))
+            progress_bar.set_postfix_str(f"{format_size(stats['bytes'])} seen, {stats['skipped']} unchanged folders skipped",
+                                         refresh=False)
     conn.commit()
+    return stats
 
 # Function to search hard drives completely and record everything
 def search_hard_drives():
@@ -45,56 +85,180 @@ def search_hard_drives():
     # Prompt the user to include subfolders
     include_subfolders = input("Include subfolders? (yes/no): ").lower() == 'yes'
     
+    # Prompt the user for bulk-load mode: no fsync and no secondary indexes until the scan finishes
+    bulk_load = input("Use bulk-load mode (faster, but a crash can corrupt the database)? (yes/no): ").lower() == 'yes'
+    
     # Connect to the database
     conn = sqlite3.connect(db_name)
     create_files_table(conn)  # Create the 'files' table
-    c = conn.cursor()
+    if bulk_load:
+        begin_bulk_load(conn)
     
-    # Perform the search on the selected drive
+    # Perform the search on the selected drive in a single pass. The file count of a previous
+    # scan, if the database has one, serves as the progress total; otherwise the rate is shown.
     print(f"Scanning drive: {drive_path}")
-    total_files = 0
-    for root, dirs, files in os.walk(drive_path):
-        total_files += len(files)
-    progress_bar = tqdm(total=total_files, desc="Processing files", unit="file")
+    progress_bar = tqdm(total=previous_file_count(conn, drive_path), desc="Processing files", unit="file")
     start_time = datetime.now()
-    for root, dirs, files in os.walk(drive_path):
-        for name in files:
-            file_path = os.path.join(root, name)
-            c.execute("SELECT * FROM files WHERE address=?", (file_path,))
-            if not c.fetchone():
-                file_format = os.path.splitext(name)[-1].lower()
-                size = int(os.path.getsize(file_path) / 1024)
-                created_date = None
-                try:
-                    created_date = datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
-                except OSError as e:
-                    pass  # Ignore error and continue
-                c.execute("INSERT INTO files (type, file_format, name, address, size, created_date) VALUES (?, ?, ?, ?, ?, ?)",
-                          ('file', file_format, name, file_path, size, created_date))
-            progress_bar.update(1)
-        if include_subfolders:
-            for name in dirs:
-                dir_path = os.path.join(root, name)
-                c.execute("SELECT * FROM files WHERE address=?", (dir_path,))
-                if not c.fetchone():
-                    created_date = None
-                    try:
-                        created_date = datetime.fromtimestamp(os.path.getctime(dir_path)).strftime('%Y-%m-%d %H:%M:%S')
-                    except OSError as e:
-                        pass  # Ignore error and continue
-                    c.execute("INSERT INTO files (type, name, address, created_date) VALUES (?, ?, ?, ?)",
-                              ('folder', name, dir_path, created_date))
-                progress_bar.update(1)
+    stats = incremental_update(conn, drive_path, include_subfolders, None, verify_unchanged=True,
+                               progress_bar=progress_bar, update_dir_stats=False)
+    # Every folder was listed, so the folder totals are cheaper to compute in one bottom-up pass
+    rebuild_dir_stats(conn.cursor())
+    conn.commit()
+    if bulk_load:
+        end_bulk_load(conn)
     
     progress_bar.close()
     end_time = datetime.now()
     time_elapsed = (end_time - start_time).total_seconds()
     print(f"Search completed and data recorded successfully. Database '{db_name}' created.")
+    print(f"Files recorded: {stats['files']} ({format_size(stats['bytes'])}).")
     print(f"Time elapsed: {time_elapsed:.2f} seconds.")
 
-    # Commit changes and close the connection
+    # Close the connection
+    conn.close()
+
+# Duplicate finder settings: bytes hashed at each end of a file before any full read, threads used for
+# hashing, read buffer for full hashes and the size from which full hashes read through mmap instead
+PARTIAL_HASH_BYTES = 64 * 1024
+HASH_WORKERS = 8
+READ_BUFFER_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+# Function to create the table caching content hashes between duplicate searches
+def create_hashes_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS file_hashes (
+                    inode INTEGER,
+                    size INTEGER,
+                    mtime INTEGER,
+                    partial_hash TEXT,
+                    full_hash TEXT,
+                    PRIMARY KEY (inode, size, mtime)
+                )''')
+    conn.commit()
+
+# Function to stat a duplicate candidate, returning (address, size, mtime, device, inode) or None
+def stat_candidate(address):
+    try:
+        st = os.stat(address)
+    except OSError:
+        return None
+    return (address, st.st_size, st.st_mtime_ns, st.st_dev, st.st_ino)
+
+# Function to hash the first and last PARTIAL_HASH_BYTES of a file
+def hash_file_ends(address, size):
+    digest = hashlib.blake2b()
+    with open(address, 'rb') as f:
+        digest.update(f.read(PARTIAL_HASH_BYTES))
+        if size > PARTIAL_HASH_BYTES:
+            f.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+# Function to hash the full contents of a file
+def hash_file_contents(address, size):
+    digest = hashlib.blake2b()
+    with open(address, 'rb') as f:
+        # The file may have shrunk since it was stat'ed, and an empty file cannot be mapped
+        if size >= MMAP_THRESHOLD and os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+        else:
+            for chunk in iter(lambda: f.read(READ_BUFFER_SIZE), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to hash candidates in parallel, reusing hashes cached for the same (inode, size, mtime)
+def hash_candidates(conn, executor, candidates, column, hash_function, desc):
+    c = conn.cursor()
+    hashes = {}
+    to_hash = []
+    for candidate in candidates:
+        address, size, mtime, device, inode = candidate
+        c.execute(f"SELECT {column} FROM file_hashes WHERE inode=? AND size=? AND mtime=?", (inode, size, mtime))
+        row = c.fetchone()
+        if row and row[0]:
+            hashes[address] = row[0]
+        else:
+            to_hash.append(candidate)
+    futures = {executor.submit(hash_function, candidate[0], candidate[1]): candidate for candidate in to_hash}
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc=desc, unit="file"):
+        address, size, mtime, device, inode = futures[future]
+        try:
+            hashes[address] = future.result()
+        except (OSError, ValueError):
+            continue  # Ignore error and continue
+        c.execute(f"INSERT INTO file_hashes (inode, size, mtime, {column}) VALUES (?, ?, ?, ?) "
+                  f"ON CONFLICT(inode, size, mtime) DO UPDATE SET {column}=excluded.{column}",
+                  (inode, size, mtime, hashes[address]))
     conn.commit()
+    return hashes
+
+# Function to split candidate groups by a key, keeping only groups that still hold two or more distinct files
+def regroup(groups, key):
+    result = []
+    for group in groups:
+        buckets = defaultdict(list)
+        for candidate in group:
+            candidate_key = key(candidate)
+            if candidate_key is not None:
+                buckets[candidate_key].append(candidate)
+        result.extend(bucket for bucket in buckets.values() if len(bucket) > 1)
+    return result
+
+# Function to find files with identical contents. Candidates are narrowed down in stages: equal size in
+# the database, equal size on disk, equal hash of both ends, and finally equal hash of the full contents.
+# Returns groups of (address, size, mtime, device, inode) sorted by reclaimable bytes.
+def find_duplicates(conn, workers=HASH_WORKERS):
+    create_hashes_table(conn)
+    c = conn.cursor()
+    c.execute("""SELECT address, size FROM files
+                 WHERE type='file' AND deleted=0 AND size IN (
+                     SELECT size FROM files WHERE type='file' AND deleted=0 GROUP BY size HAVING COUNT(*) > 1)
+                 ORDER BY size""")
+    size_groups = defaultdict(list)
+    for address, size in c.fetchall():
+        size_groups[size].append(address)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        groups = []
+        for addresses in size_groups.values():
+            group = [candidate for candidate in executor.map(stat_candidate, addresses) if candidate is not None]
+            # Hardlinks share their data, so only one path per (device, inode) is kept
+            group = list({(candidate[3], candidate[4]): candidate for candidate in group}.values())
+            groups.append(group)
+        groups = regroup(groups, lambda candidate: candidate[1] or None)  # empty files reclaim nothing
+        partial = hash_candidates(conn, executor, [candidate for group in groups for candidate in group],
+                                  'partial_hash', hash_file_ends, "Hashing file ends")
+        groups = regroup(groups, lambda candidate: partial.get(candidate[0]))
+        full = hash_candidates(conn, executor, [candidate for group in groups for candidate in group],
+                               'full_hash', hash_file_contents, "Hashing full contents")
+        groups = regroup(groups, lambda candidate: full.get(candidate[0]))
+    groups.sort(key=lambda group: group[0][1] * (len(group) - 1), reverse=True)
+    return groups
+
+# Function to report duplicate files recorded in a DataSafari or FileFusion database
+def find_duplicate_files():
+    db_path = input("Enter the path to the database: ")
+    if not os.path.exists(db_path):
+        print("Database not found.")
+        return
+    groups_to_show = input("Number of duplicate groups to show (default 20): ")
+    groups_to_show = int(groups_to_show) if groups_to_show.isdigit() else 20
+    
+    conn = sqlite3.connect(db_path)
+    create_files_table(conn)
+    start_time = datetime.now()
+    groups = find_duplicates(conn)
     conn.close()
+    
+    reclaimable = sum(group[0][1] * (len(group) - 1) for group in groups)
+    for group in groups[:groups_to_show]:
+        size = group[0][1]
+        print(f"\n{len(group)} copies of {format_size(size)}, {format_size(size * (len(group) - 1))} reclaimable:")
+        for candidate in group:
+            print(f"  {candidate[0]}")
+    time_elapsed = (datetime.now() - start_time).total_seconds()
+    print(f"\nDuplicate groups found: {len(groups)}, total reclaimable: {format_size(reclaimable)}.")
+    print(f"Time elapsed: {time_elapsed:.2f} seconds.")
 
 # Function to update an existing database
 def update_database():
@@ -121,90 +285,100 @@ def update_database():
     # Connect to the database
     conn = sqlite3.connect(db_path)
     create_files_table(conn)  # Create the 'files' table
-    c = conn.cursor()
     
     # Prompt the user to include subfolders
     include_subfolders = input("Include subfolders? (yes/no): ").lower() == 'yes'
     
-    # Define excluded file types and directories
-    excluded_file_types = {'.ini', '.tmp'}
-    excluded_directories = {'$RECYCLE.BIN', '$IQY2E5Z'}
+    # Folders whose mtime is unchanged are skipped unless the user asks to re-check their files
+    verify_unchanged = input("Re-check files in unchanged folders? (yes/no): ").lower() == 'yes'
     
-    # Perform the update on the database
-    total_files = 0
-    for choice in drive_numbers:
-        drive_path = partitions[choice - 1].mountpoint
-        for root, dirs, files in os.walk(drive_path):
-            total_files += len(files)
-    progress_bar = tqdm(total=total_files, desc="Updating database", unit="file")
+    # Compile the exclusion rules once, from a rules file or the defaults
+    file_filter = compile_filter(prompt_filter_rules(DEFAULT_FILTER_RULES))
+    
+    # Perform the update on the database, listing only folders that changed since the last scan
+    progress_bar = tqdm(desc="Updating database", unit="file")
     start_time = datetime.now()
+    totals = {'listed': 0, 'skipped': 0, 'changed': 0}
     for choice in drive_numbers:
         drive_path = partitions[choice - 1].mountpoint
-        for root, dirs, files in os.walk(drive_path):
-            for name in files:
-                if os.path.splitext(name)[-1].lower() in excluded_file_types:
-                    continue
-                file_path = os.path.join(root, name)
-                if any(excluded_dir in file_path for excluded_dir in excluded_directories):
-                    continue
-                c.execute("SELECT * FROM files WHERE address=?", (file_path,))
-                if not c.fetchone():
-                    file_format = os.path.splitext(name)[-1].lower()
-                    size = int(os.path.getsize(file_path) / 1024)
-                    created_date = None
-                    try:
-                        created_date = datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
-                    except OSError as e:
-                        pass  # Ignore error and continue
-                    c.execute("INSERT INTO files (type, file_format, name, address, size, created_date) VALUES (?, ?, ?, ?, ?, ?)",
-                              ('file', file_format, name, file_path, size, created_date))
-                    progress_bar.update(1)
-            if include_subfolders:
-                for name in dirs:
-                    dir_path = os.path.join(root, name)
-                    if any(excluded_dir in dir_path for excluded_dir in excluded_directories):
-                        continue
-                    try:
-                        c.execute("SELECT * FROM files WHERE address=?", (dir_path,))
-                        if not c.fetchone():
-                            created_date = None
-                            try:
-                                created_date = datetime.fromtimestamp(os.path.getctime(dir_path)).strftime('%Y-%m-%d %H:%M:%S')
-                            except OSError as e:
-                                pass  # Ignore error and continue
-                            c.execute("INSERT INTO files (type, name, address, created_date) VALUES (?, ?, ?, ?)",
-                                      ('folder', name, dir_path, created_date))
-                            progress_bar.update(1)
-                    except OSError as e:
-                        pass  # Ignore error and continue
+        stats = incremental_update(conn, drive_path, include_subfolders, file_filter, verify_unchanged,
+                                   progress_bar)
+        for key in totals:
+            totals[key] += stats[key]
     
     progress_bar.close()
     end_time = datetime.now()
     time_elapsed = (end_time - start_time).total_seconds()
     print(f"Database '{db_path}' updated successfully.")
+    print(f"Folders rescanned: {totals['listed']}, unchanged folders skipped: {totals['skipped']}, rows changed: {totals['changed']}.")
     print(f"Time elapsed: {time_elapsed:.2f} seconds.")
 
     # Commit changes and close the connection
     conn.commit()
     conn.close()
 
+# Function to list the largest folders below a folder from the dir_stats table
+def largest_directories(conn, dir_path, limit=10):
+    low, high = subtree_bounds(dir_path)
+    c = conn.cursor()
+    c.execute("""SELECT address, total_size, file_count, newest_mtime FROM dir_stats
+                 WHERE address>=? AND address<? ORDER BY total_size DESC LIMIT ?""", (low, high, limit))
+    return c.fetchall()
+
+# Function to show the largest folders below a folder without scanning the drive
+def show_largest_folders():
+    db_path = input("Enter the path to the database: ")
+    if not os.path.exists(db_path):
+        print("Database not found.")
+        return
+    
+    # Connect to the database
+    conn = sqlite3.connect(db_path)
+    create_files_table(conn)  # Create the 'files' table
+    
+    dir_path = os.path.normpath(input("Enter the folder to analyze: "))
+    try:
+        limit = int(input("How many folders to show? (default 10): ") or 10)
+    except ValueError:
+        limit = 10
+    
+    c = conn.cursor()
+    c.execute("SELECT total_size, file_count FROM dir_stats WHERE address=?", (dir_path,))
+    row = c.fetchone()
+    if row is None:
+        print("That folder is not in the database.")
+    else:
+        print(f"{dir_path}: {format_size(row[0])} in {row[1]} files.")
+        for address, total_size, file_count, newest_mtime in largest_directories(conn, dir_path, limit):
+            newest = datetime.fromtimestamp(newest_mtime / 1e9).strftime('%Y-%m-%d %H:%M:%S') if newest_mtime else '-'
+            print(f"{format_size(total_size):>10}  {file_count:>8} files  newest {newest}  {address}")
+    
+    # Close the connection
+    conn.close()
+
 def main():
     print("Welcome to DataSafari!")
     while True:
         print("\nMENU:")
         print("1. Search Hard Drives")
         print("2. Update Existing Database")
-        print("3. Exit")
-        choice = input("Enter your choice (1-3): ")
+        print("3. Find Duplicate Files")
+        print("4. Show Largest Folders")
+        print("5. Exit")
+        choice = input("Enter your choice (1-5): ")
         if choice == '1':
             search_hard_drives()
         elif choice == '2':
             update_database()
         elif choice == '3':
+            find_duplicate_files()
+        elif choice == '4':
+            show_largest_folders()
+        elif choice == '5':
             print("Exiting the program.")
             break
         else:
-            print("Invalid choice. Please enter a number from 1 to 3.")
+            print("Invalid choice. Please enter a number from 1 to 5.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,49 +1,90 @@
 import os
+import csv
+import gzip
+import json
+import time
 import sqlite3
 import shutil
-from datetime import datetime
+
+from scan_common import (rebuild_dir_stats, apply_dir_stats_delta, create_files_table,
+                         begin_bulk_load, end_bulk_load, make_row, prompt_filter_rules,
+                         compile_filter, file_allowed, dir_allowed, format_size, UPSERT_FILE_SQL)
+
+# Number of rows written per executemany call
+BATCH_SIZE = 5000
+
+# Number of rows fetched from the database per export batch
+EXPORT_BATCH_ROWS = 100000
+
+# Columns written by the .csv, .jsonl, .parquet and .arrow exports; times are nanoseconds since the epoch
+EXPORT_COLUMNS = ['id', 'type', 'file_format', 'name', 'address', 'size', 'ctime', 'mtime', 'atime', 'parent', 'deleted']
+
+# Age buckets used by the age histogram query, as (upper bound in days, label)
+AGE_BUCKETS = [(1, '< 1 day'), (7, '1-7 days'), (30, '1-4 weeks'), (90, '1-3 months'),
+               (365, '3-12 months'), (3 * 365, '1-3 years'), (None, '3+ years')]
+
+# Function to upsert rows in batches
+def upsert_rows(c, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            c.executemany(UPSERT_FILE_SQL, batch)
+            batch = []
+    if batch:
+        c.executemany(UPSERT_FILE_SQL, batch)
+
+# Function to generate rows for every file and folder below a directory that passes the filter
+def walk_rows(directory, file_filter, include_subfolders):
+    # Names are matched before entry.stat(), so filtered files and excluded folders are never stat'ed
+    # Parents are stored as absolute, normalized paths, so a trailing separator or relative path gives the same rows
+    stack = [os.path.abspath(directory)]
+    while stack:
+        root = stack.pop()
+        try:
+            with os.scandir(root) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if not dir_allowed(file_filter, entry.name):
+                                continue
+                            if not entry.is_symlink():
+                                stack.append(entry.path)
+                            if include_subfolders:
+                                yield make_row('folder', entry.name, entry.path, root, entry.stat())
+                        elif file_allowed(file_filter, entry.name):
+                            yield make_row('file', entry.name, entry.path, root, entry.stat())
+                    except OSError:
+                        pass  # Ignore error and continue
+        except OSError:
+            pass  # Ignore error and continue
+
+# Function to compile the rules file and the chosen format into one filter
+def build_filter(filter_rules, format_option='all'):
+    if format_option != 'all':
+        filter_rules = filter_rules + [('include-ext', format_option)]
+    return compile_filter(filter_rules)
 
 # Function to create a database from a directory
 def create_database():
     directory = input("Enter the directory path: ")
     format_option = input("Enter the file format to query (e.g., .jpg) or enter 'all' for all formats: ")
     include_subfolders = input("Include subfolders? (yes/no): ").lower() == 'yes'
+    file_filter = build_filter(prompt_filter_rules(), format_option)
     db_name = input("Enter the database name (without extension): ")
     if not db_name.endswith('.db'):
         db_name += '.db'
+    bulk_load = input("Use bulk-load mode (faster, but a crash can corrupt the database)? (yes/no): ").lower() == 'yes'
     conn = sqlite3.connect(db_name)
+    create_files_table(conn)
+    if bulk_load:
+        begin_bulk_load(conn)
     c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS files (
-                    id INTEGER PRIMARY KEY,
-                    type TEXT,
-                    file_format TEXT,
-                    name TEXT,
-                    address TEXT,
-                    size INTEGER,
-                    created_date TEXT
-                )''')
-    conn.commit()
-    for root, dirs, files in os.walk(directory):
-        for name in files:
-            file_path = os.path.join(root, name)
-            file_format = os.path.splitext(name)[-1].lower()
-            if format_option == 'all' or file_format == format_option:
-                c.execute("SELECT * FROM files WHERE address=?", (file_path,))
-                if not c.fetchone():
-                    size = int(os.path.getsize(file_path) / 1024)
-                    created_date = datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
-                    c.execute("INSERT INTO files (type, file_format, name, address, size, created_date) VALUES (?, ?, ?, ?, ?, ?)",
-                              ('file', file_format, name, file_path, size, created_date))
-    if include_subfolders:
-        for root, dirs, files in os.walk(directory):
-            for name in dirs:
-                dir_path = os.path.join(root, name)
-                c.execute("SELECT * FROM files WHERE address=?", (dir_path,))
-                if not c.fetchone():
-                    created_date = datetime.fromtimestamp(os.path.getctime(dir_path)).strftime('%Y-%m-%d %H:%M:%S')
-                    c.execute("INSERT INTO files (type, name, address, created_date) VALUES (?, ?, ?, ?)",
-                              ('folder', name, dir_path, created_date))
+    upsert_rows(c, walk_rows(directory, file_filter, include_subfolders))
+    rebuild_dir_stats(c)
     conn.commit()
+    if bulk_load:
+        end_bulk_load(conn)
     conn.close()
     print(f"Database '{db_name}' created successfully.")
 
@@ -53,19 +94,20 @@ def add_single_file():
     file_name = input("Enter the file name: ")
     db_path = input("Enter the path to the database: ")
     conn = sqlite3.connect(db_path)
+    create_files_table(conn)
     c = conn.cursor()
-    file_path = os.path.join(directory, file_name)
+    # Absolute, normalized paths match the addresses and parents written by create_database and update_database
+    file_path = os.path.abspath(os.path.join(directory, file_name))
     if not os.path.exists(file_path):
         print("File does not exist.")
         conn.close()
         return
-    file_format = os.path.splitext(file_name)[-1].lower()
-    c.execute("SELECT * FROM files WHERE address=?", (file_path,))
-    if not c.fetchone():
-        size = int(os.path.getsize(file_path) / 1024)
-        created_date = datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
-        c.execute("INSERT INTO files (type, file_format, name, address, size, created_date) VALUES (?, ?, ?, ?, ?, ?)",
-                  ('file', file_format, file_name, file_path, size, created_date))
+    directory = os.path.dirname(file_path)
+    row = make_row('file', os.path.basename(file_path), file_path, directory, os.stat(file_path))
+    c.execute("INSERT INTO files (type, file_format, name, address, size, ctime, mtime, atime, parent, inode) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(address) DO NOTHING", row)
+    if c.rowcount:
+        apply_dir_stats_delta(c, directory, row[4], 1, row[6])
         print("File added successfully.")
     else:
         print("File already exists in the database.")
@@ -77,43 +119,167 @@ def update_database():
     db_path = input("Enter the path to the database: ")  # Prompt for database path
     directory = input("Enter the directory path: ")
     include_subfolders = input("Include subfolders? (yes/no): ").lower() == 'yes'
+    file_filter = build_filter(prompt_filter_rules())
     conn = sqlite3.connect(db_path)
+    create_files_table(conn)
     c = conn.cursor()
-    for root, dirs, files in os.walk(directory):
-        for name in files:
-            file_path = os.path.join(root, name)
-            c.execute("SELECT * FROM files WHERE address=?", (file_path,))
-            if not c.fetchone():
-                file_format = os.path.splitext(name)[-1].lower()
-                size = int(os.path.getsize(file_path) / 1024)
-                created_date = datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
-                c.execute("INSERT INTO files (type, file_format, name, address, size, created_date) VALUES (?, ?, ?, ?, ?, ?)",
-                          ('file', file_format, name, file_path, size, created_date))
-    if include_subfolders:
-        for root, dirs, files in os.walk(directory):
-            for name in dirs:
-                dir_path = os.path.join(root, name)
-                c.execute("SELECT * FROM files WHERE address=?", (dir_path,))
-                if not c.fetchone():
-                    created_date = datetime.fromtimestamp(os.path.getctime(dir_path)).strftime('%Y-%m-%d %H:%M:%S')
-                    c.execute("INSERT INTO files (type, name, address, created_date) VALUES (?, ?, ?, ?)",
-                              ('folder', name, dir_path, created_date))
+    upsert_rows(c, walk_rows(directory, file_filter, include_subfolders))
+    rebuild_dir_stats(c)
     conn.commit()
     conn.close()
     print("Database updated successfully.")
 
-# Function to export a database to a .txt file
+# Function to yield rows from a cursor in batches, so exports never hold the whole table in memory
+def fetch_batches(c, batch_rows=EXPORT_BATCH_ROWS):
+    while True:
+        rows = c.fetchmany(batch_rows)
+        if not rows:
+            break
+        yield rows
+
+# Function to open a text export file, compressing it when the name ends with .gz
+def open_text_output(path, newline=None):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline=newline)
+    return open(path, 'w', encoding='utf-8', newline=newline)
+
+# Function to import pyarrow, which only the .parquet and .arrow formats and queries need
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        print("This option needs pyarrow. Install it with: pip install pyarrow")
+        return None
+    return pyarrow
+
+# Function to write the files table to Parquet or Arrow IPC one record batch at a time
+def export_columnar(c, path, columnar_format):
+    pa = import_pyarrow()
+    if pa is None:
+        return False
+    schema = pa.schema([('id', pa.int64()), ('type', pa.string()), ('file_format', pa.string()), ('name', pa.string()),
+                        ('address', pa.string()), ('size', pa.int64()), ('ctime', pa.int64()), ('mtime', pa.int64()),
+                        ('atime', pa.int64()), ('parent', pa.string()), ('deleted', pa.int8())])
+    if columnar_format == 'parquet':
+        writer = pa.parquet.ParquetWriter(path, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    with writer:
+        for rows in fetch_batches(c):
+            columns = list(zip(*rows))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+    return True
+
+# Function to export a database to .txt, .csv, .jsonl, .parquet or .arrow, chosen by the file extension
 def export_database():
     db_path = input("Enter the path to the database: ") 
-    txt_file = input("Enter the .txt file name to export: ")
+    output_file = input("Enter the file name to export (.txt, .csv, .jsonl, .parquet or .arrow; add .gz to compress text): ")
     conn = sqlite3.connect(db_path)
+    create_files_table(conn)
     c = conn.cursor()
-    c.execute("SELECT * FROM files")
-    with open(txt_file, 'w', encoding='utf-8') as f:  
-        for row in c.fetchall():
-            f.write(','.join(map(str, row)) + '\n')
+    extension = os.path.splitext(output_file[:-3] if output_file.endswith('.gz') else output_file)[-1].lower()
+    exported = True
+    if extension in ('.parquet', '.arrow'):
+        c.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM files")
+        exported = export_columnar(c, output_file, extension[1:])
+    elif extension in ('.csv', '.jsonl'):
+        c.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM files")
+        # The csv module writes its own line endings
+        with open_text_output(output_file, '' if extension == '.csv' else None) as f:
+            if extension == '.csv':
+                writer = csv.writer(f)
+                writer.writerow(EXPORT_COLUMNS)
+                for rows in fetch_batches(c):
+                    writer.writerows(rows)
+            else:
+                for rows in fetch_batches(c):
+                    f.write(''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in rows))
+    else:
+        c.execute("SELECT id, type, file_format, name, address, size_kb, created_date FROM files_view")
+        with open_text_output(output_file) as f:
+            for rows in fetch_batches(c):
+                f.write(''.join(','.join(map(str, row)) + '\n' for row in rows))
     conn.close()
-    print(f"Database '{db_path}' exported to '{txt_file}' successfully.")
+    if exported:
+        print(f"Database '{db_path}' exported to '{output_file}' successfully.")
+
+# Function to load the live (not deleted) files of a .parquet or .arrow export
+def load_inventory(pa, path):
+    columns = ['type', 'file_format', 'address', 'size', 'mtime', 'deleted']
+    if path.endswith('.parquet'):
+        table = pa.parquet.read_table(path, columns=columns)
+    else:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all().select(columns)
+    pc = pa.compute
+    return table.filter(pc.and_(pc.equal(table['type'], 'file'), pc.equal(table['deleted'], 0)))
+
+# Function to total bytes and file counts per extension
+def query_bytes_per_extension(pa, files):
+    totals = files.group_by('file_format').aggregate([('size', 'sum'), ('size', 'count')])
+    totals = totals.sort_by([('size_sum', 'descending')])
+    return [(row['file_format'] or '(none)', row['size_sum'] or 0, row['size_count']) for row in totals.to_pylist()]
+
+# Function to total bytes and file counts per folder directly below a directory prefix
+def query_bytes_per_directory(pa, files, prefix):
+    pc = pa.compute
+    prefix = prefix.rstrip('\\/') + os.sep
+    files = files.filter(pc.starts_with(files['address'], prefix))
+    # The first path component after the prefix names the child folder; files directly in the prefix stay apart
+    parts = pc.split_pattern_regex(pc.utf8_slice_codeunits(files['address'], len(prefix)), r'[\\/]', max_splits=1)
+    child = pc.if_else(pc.greater(pc.list_value_length(parts), 1),
+                       pc.binary_join_element_wise(prefix, pc.list_element(parts, 0), ''), '(files in this folder)')
+    table = pa.table({'child': child, 'size': files['size']})
+    totals = table.group_by('child').aggregate([('size', 'sum'), ('size', 'count')])
+    totals = totals.sort_by([('size_sum', 'descending')])
+    return [(row['child'], row['size_sum'] or 0, row['size_count']) for row in totals.to_pylist()]
+
+# Function to bucket files by time since their last modification
+def query_age_histogram(pa, files):
+    pc = pa.compute
+    age_days = pc.divide(pc.subtract(time.time_ns(), files['mtime']), 86400 * 10 ** 9)
+    results = []
+    lower = 0
+    for upper, label in AGE_BUCKETS:
+        mask = pc.greater_equal(age_days, lower)
+        if upper is not None:
+            mask = pc.and_(mask, pc.less(age_days, upper))
+        selected = pc.filter(files['size'], mask)
+        results.append((label, pc.sum(selected).as_py() or 0, len(selected)))
+        lower = upper
+    return results
+
+# Function to answer aggregate questions about an exported .parquet or .arrow inventory
+def query_inventory():
+    pa = import_pyarrow()
+    if pa is None:
+        return
+    path = input("Enter the path to the .parquet or .arrow export: ")
+    if not os.path.exists(path):
+        print("File does not exist.")
+        return
+    print("1. Bytes per extension")
+    print("2. Bytes per folder below a directory prefix")
+    print("3. Age histogram (by modification time)")
+    query = input("Enter your choice (1-3): ")
+    files = load_inventory(pa, path)
+    if query == '1':
+        results = query_bytes_per_extension(pa, files)
+    elif query == '2':
+        results = query_bytes_per_directory(pa, files, input("Enter the directory prefix: "))
+    elif query == '3':
+        results = query_age_histogram(pa, files)
+    else:
+        print("Invalid choice.")
+        return
+    print(f"{'Group':<60} {'Size':>12} {'Files':>10}")
+    print("-" * 84)
+    for group, size, count in results:
+        print(f"{group:<60} {format_size(size):>12} {count:>10}")
 
 # Main function
 def main():
@@ -122,9 +288,10 @@ def main():
         print("1. Create Database from a directory")
         print("2. Add a single file to the database")
         print("3. Update a database")
-        print("4. Export a database to a .txt file")
-        print("5. Exit")
-        choice = input("Enter your choice (1-5): ")
+        print("4. Export a database (.txt, .csv, .jsonl, .parquet, .arrow)")
+        print("5. Query an exported inventory")
+        print("6. Exit")
+        choice = input("Enter your choice (1-6): ")
         if choice == '1':
             create_database()
         elif choice == '2':
@@ -134,10 +301,12 @@ def main():
         elif choice == '4':
             export_database()
         elif choice == '5':
+            query_inventory()
+        elif choice == '6':
             print("Exiting the program.")
             break
         else:
-            print("Invalid choice. Please enter a number from 1 to 5.")
+            print("Invalid choice. Please enter a number from 1 to 6.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
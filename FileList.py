@@ -1,19 +1,39 @@
 import os
 
+from sort_helpers import external_sort, natural_key, write_lines
+
+def iter_names(directory_path, recursive=False):
+    # Stream entry names with os.scandir instead of building the whole listing; recursive listings
+    # yield paths relative to directory_path
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(directory_path, relative_dir)) as entries:
+                for entry in entries:
+                    name = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+                    yield name
+                    if recursive and entry.is_dir(follow_symlinks=False):
+                        stack.append(name)
+        except OSError as e:
+            print(f"Skipping {os.path.join(directory_path, relative_dir)}: {e}")
+
 def main():
     # Prompt user for directory path
     directory_path = input("Enter the directory path: ")
 
+    # Prompt for the listing options
+    recursive = input("Include subfolders? (yes/no): ").lower() == 'yes'
+    natural = input("Natural sort order, so file2 comes before file10? (yes/no): ").lower() == 'yes'
+
     # List all files in the directory and sort them by file name
-    files = sorted(os.listdir(directory_path))
+    files = external_sort(iter_names(directory_path, recursive), key=natural_key if natural else None)
 
     # Write the sorted list of files to a .txt file
-    with open('file_list.txt', 'w') as file:
-        for f in files:
-            file.write(f + '\n')
+    count = write_lines('file_list.txt', files)
 
     # Display success message
-    print("File list has been saved to file_list.txt")
+    print(f"File list of {count} entries has been saved to file_list.txt")
 
     # Wait for user to press enter
     input("Press Enter to exit...")
@@ -3,7 +3,212 @@
 # ErfanNamira
 # https://github.com/ErfanNamira/PythonMiniProjects
 
-from passlib.hash import sha256_crypt
+import os
+import sys
+import math
+import time
+import argparse
+import multiprocessing
+from collections import defaultdict
+from passlib.hash import sha256_crypt, bcrypt, argon2, pbkdf2_sha256
+from passlib.context import CryptContext
+from passlib.exc import MissingBackendError
+
+# Supported schemes; every one takes its cost as "rounds" (a log2 cost for bcrypt)
+SCHEMES = {
+    "sha256_crypt": sha256_crypt,
+    "bcrypt": bcrypt,
+    "argon2": argon2,
+    "pbkdf2_sha256": pbkdf2_sha256,
+}
+
+# Schemes whose work doubles with each extra round rather than growing linearly
+LOG2_SCHEMES = {"bcrypt"}
+
+# Default number of hashing processes and passwords handed to a process at a time
+HASH_WORKERS = os.cpu_count() or 1
+CHUNK_SIZE = 16
+
+# Hasher and CryptContext configured once per worker process
+worker_hasher = None
+worker_context = None
+
+# Latency percentiles reported by the verify command
+PERCENTILES = (50, 90, 99)
+
+def configure_hasher(scheme, rounds=None):
+    handler = SCHEMES[scheme]
+    return handler.using(rounds=rounds) if rounds else handler
+
+def init_worker(scheme, rounds):
+    global worker_hasher
+    worker_hasher = configure_hasher(scheme, rounds)
+
+def hash_password(password):
+    return worker_hasher.hash(password)
+
+def read_passwords(stream):
+    # One password per line; only the line ending is removed, so spaces inside passwords are kept
+    for line in stream:
+        yield line.rstrip("\r\n")
+
+def hash_batch(input_stream, output_stream, scheme="sha256_crypt", rounds=None, workers=HASH_WORKERS):
+    # Hash a stream of passwords across a process pool. imap keeps the input order and hands results
+    # back as they complete, so output starts at once and memory stays flat however long the list is.
+    count = 0
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(scheme, rounds)) as pool:
+        for hashed_password in pool.imap(hash_password, read_passwords(input_stream), chunksize=CHUNK_SIZE):
+            output_stream.write(hashed_password + "\n")
+            count += 1
+    elapsed = time.perf_counter() - start_time
+    return count, elapsed
+
+def build_context(scheme, rounds=None):
+    # Every supported scheme can be verified, but only the target scheme is current: hashes in any other
+    # scheme, or in the target scheme with fewer than the given rounds, need an update
+    settings = {}
+    if rounds:
+        settings[f"{scheme}__default_rounds"] = rounds
+        settings[f"{scheme}__min_rounds"] = rounds
+    return CryptContext(schemes=[scheme] + [name for name in SCHEMES if name != scheme], default=scheme,
+                        deprecated="auto", **settings)
+
+def init_verify_worker(scheme, rounds):
+    global worker_context
+    worker_context = build_context(scheme, rounds)
+
+def check_line(line):
+    # A line is "password<TAB>hash" to verify, or a bare hash to identify only. Hashes never contain
+    # tabs, so the password may. Returns (status, scheme, needs update, upgraded hash, verify seconds).
+    password, separator, hashed_password = line.rpartition("\t")
+    if not separator:
+        password, hashed_password = None, line
+    scheme = worker_context.identify(hashed_password, required=False)
+    if scheme is None:
+        return "unknown", None, False, None, 0.0
+    try:
+        needs_update = worker_context.needs_update(hashed_password)
+        if password is None:
+            return "identified", scheme, needs_update, None, 0.0
+        start_time = time.perf_counter()
+        verified = worker_context.verify(password, hashed_password)
+        elapsed = time.perf_counter() - start_time
+    except ValueError:
+        return "malformed", scheme, False, None, 0.0
+    # Only a verified password can be rehashed, since the old hash cannot be converted on its own
+    upgraded = worker_context.hash(password) if verified and needs_update else None
+    return "ok" if verified else "fail", scheme, needs_update, upgraded, elapsed
+
+def percentile(sorted_values, percent):
+    # Nearest-rank percentile of an already sorted list
+    return sorted_values[max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)]
+
+def verify_batch(input_stream, output_stream, scheme="sha256_crypt", rounds=None, workers=HASH_WORKERS):
+    # Verify or identify a stream of lines across a process pool, writing one result line per input
+    # line in input order: status, scheme, "upgrade" when the hash needs an update, and the upgraded hash
+    statuses = defaultdict(int)
+    latencies = defaultdict(list)
+    upgrades = 0
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_verify_worker, initargs=(scheme, rounds)) as pool:
+        for status, line_scheme, needs_update, upgraded, elapsed in pool.imap(check_line, read_passwords(input_stream),
+                                                                              chunksize=CHUNK_SIZE):
+            output_stream.write(f"{status}\t{line_scheme or ''}\t{'upgrade' if needs_update else ''}\t{upgraded or ''}\n")
+            statuses[status] += 1
+            if status in ("ok", "fail"):
+                latencies[line_scheme].append(elapsed)
+            upgrades += upgraded is not None
+    elapsed = time.perf_counter() - start_time
+    return statuses, latencies, upgrades, elapsed
+
+def print_verify_report(statuses, latencies, upgrades, elapsed):
+    total = sum(statuses.values())
+    print(f"{total} lines in {elapsed:.2f} seconds ({total / elapsed if elapsed else 0:.1f}/s): "
+          + ", ".join(f"{count} {status}" for status, count in sorted(statuses.items())) + f", {upgrades} upgraded.",
+          file=sys.stderr)
+    print(f"{'Scheme':<16} {'Verifies':>9} " + " ".join(f"{'p' + str(percent) + ' ms':>9}" for percent in PERCENTILES),
+          file=sys.stderr)
+    for line_scheme, timings in sorted(latencies.items()):
+        timings.sort()
+        print(f"{line_scheme:<16} {len(timings):>9} "
+              + " ".join(f"{percentile(timings, percent) * 1000:>9.1f}" for percent in PERCENTILES), file=sys.stderr)
+
+def measure_verify(hasher, samples=5):
+    # Median time of verifying one password, in seconds
+    hashed_password = hasher.hash("calibration password")
+    timings = []
+    for _ in range(samples):
+        start_time = time.perf_counter()
+        hasher.verify("calibration password", hashed_password)
+        timings.append(time.perf_counter() - start_time)
+    return sorted(timings)[len(timings) // 2]
+
+def calibrate(scheme, target_ms):
+    # Time verification at the default cost, scale the cost towards the target latency, then re-measure
+    # at neighbouring costs and keep the one closest to the target
+    handler = SCHEMES[scheme]
+    rounds = handler.default_rounds
+    elapsed = measure_verify(configure_hasher(scheme, rounds))
+    ratio = target_ms / 1000 / elapsed
+    if scheme in LOG2_SCHEMES:
+        candidates = {rounds + round(math.log2(ratio)) + step for step in (-1, 0, 1)}
+    else:
+        estimate = max(1, round(rounds * ratio))
+        candidates = {max(1, round(estimate * factor)) for factor in (0.9, 1.0, 1.1)}
+    candidates = sorted(min(max(candidate, handler.min_rounds), handler.max_rounds) for candidate in candidates)
+    results = [(candidate, measure_verify(configure_hasher(scheme, candidate))) for candidate in candidates]
+    for candidate, elapsed in results:
+        print(f"{scheme} rounds={candidate}: {elapsed * 1000:.1f} ms per verify")
+    return min(results, key=lambda result: abs(result[1] * 1000 - target_ms))
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Hash passwords one at a time or in bulk.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    batch = commands.add_parser("batch", help="hash one password per line from a file or stdin")
+    batch.add_argument("--input", default="-", help="password file, or - for stdin (default)")
+    batch.add_argument("--output", default="-", help="hash file, or - for stdout (default)")
+    batch.add_argument("--scheme", choices=sorted(SCHEMES), default="sha256_crypt")
+    batch.add_argument("--rounds", type=int, help="cost setting (log2 cost for bcrypt); the scheme default if omitted")
+    batch.add_argument("--workers", type=int, default=HASH_WORKERS, help="hashing processes")
+    verify = commands.add_parser("verify", help="verify password<TAB>hash lines, or identify bare hashes, "
+                                                "and rehash those that need an update")
+    verify.add_argument("--input", default="-", help="input file, or - for stdin (default)")
+    verify.add_argument("--output", default="-", help="result file, or - for stdout (default)")
+    verify.add_argument("--scheme", choices=sorted(SCHEMES), default="sha256_crypt",
+                        help="scheme new hashes should use; hashes in other schemes need an update")
+    verify.add_argument("--rounds", type=int, help="minimum cost of the target scheme; weaker hashes need an update")
+    verify.add_argument("--workers", type=int, default=HASH_WORKERS, help="verifying processes")
+    calibration = commands.add_parser("calibrate", help="find the cost that takes the target time to verify here")
+    calibration.add_argument("--scheme", choices=sorted(SCHEMES), default="sha256_crypt")
+    calibration.add_argument("--target-ms", type=float, default=250, help="verify latency to aim for (default 250 ms)")
+    return parser.parse_args(argv)
+
+def run_command(args):
+    try:
+        if args.command in ("batch", "verify"):
+            input_stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+            output_stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+            try:
+                if args.command == "batch":
+                    count, elapsed = hash_batch(input_stream, output_stream, args.scheme, args.rounds, args.workers)
+                else:
+                    results = verify_batch(input_stream, output_stream, args.scheme, args.rounds, args.workers)
+            finally:
+                if input_stream is not sys.stdin:
+                    input_stream.close()
+                if output_stream is not sys.stdout:
+                    output_stream.close()
+            if args.command == "batch":
+                print(f"{count} passwords hashed in {elapsed:.2f} seconds ({count / elapsed if elapsed else 0:.1f}/s).",
+                      file=sys.stderr)
+            else:
+                print_verify_report(*results)
+        else:
+            rounds, elapsed = calibrate(args.scheme, args.target_ms)
+            print(f"Recommended: --scheme {args.scheme} --rounds {rounds} ({elapsed * 1000:.1f} ms per verify)")
+    except MissingBackendError as e:
+        print(f"Error: {e}. bcrypt needs 'pip install bcrypt' and argon2 needs 'pip install argon2-cffi'.", file=sys.stderr)
 
 def main():
     password = input("Enter the password you want to hash: ")
@@ -14,4 +219,8 @@ def main():
     print("Hashed Password:", hashed_password)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Command-line arguments select batch hashing, verification or calibration; without them one password is hashed
+    if len(sys.argv) > 1:
+        run_command(parse_arguments(sys.argv[1:]))
+    else:
+        main()
\ No newline at end of file
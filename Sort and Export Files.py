@@ -4,27 +4,141 @@
 # https://github.com/ErfanNamira/PythonMiniProjects
 
 import os
-import glob
+import json
+import heapq
+from datetime import datetime
 
-# Ask the user for the folder path
-folder_path = input("Enter the folder path: ")
+from sort_helpers import external_sort, natural_key, write_lines
 
-# Get a list of all files in the folder
-file_list = glob.glob(os.path.join(folder_path, "*"))
+# Fields a listing can be sorted on and the columns written to TSV and JSONL listings
+SORT_FIELDS = ("path", "name", "ext", "size", "mtime")
+OUTPUT_FORMATS = (".txt", ".tsv", ".jsonl")
 
-# Sort the file list alphabetically
-file_list.sort()
+# Stream the entries of a folder with os.scandir, skipping hidden entries as glob("*") did
+def iter_entries(folder_path, recursive=False):
+    stack = [folder_path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    yield entry
+                    if recursive and entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+        except OSError as e:
+            print(f"Skipping {current}: {e}")
 
-# Ask the user for the output TXT file name (with .txt extension)
-output_file = input("Enter the TXT file name (e.g., sorted_files.txt): ")
+# Stream the paths of a folder
+def iter_paths(folder_path, recursive=False):
+    return (entry.path for entry in iter_entries(folder_path, recursive))
 
-# Add .txt extension if not provided by the user
-if not output_file.endswith(".txt"):
-    output_file += ".txt"
+# Stream (path, name, ext, size, mtime) records. DirEntry.stat() reuses what the directory listing
+# returned on Windows, so no extra system call is made there; folders get size 0 and no extension.
+def iter_records(folder_path, recursive=False):
+    for entry in iter_entries(folder_path, recursive):
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        is_dir = entry.is_dir(follow_symlinks=False)
+        ext = "" if is_dir else os.path.splitext(entry.name)[1].lower()
+        yield entry.path, entry.name, ext, 0 if is_dir else st.st_size, st.st_mtime_ns
 
-# Write the sorted file list to the TXT file
-with open(output_file, "w") as f:
-    for file_name in file_list:
-        f.write(file_name + "\n")
+# Wrapper that reverses the order of a value, so one sort key can mix ascending and descending fields
+class Descending:
+    __slots__ = ("value",)
 
-print(f"List of files has been sorted and saved to {output_file}.")
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+# Parse a sort spec such as "ext,-size" into (field index, descending) pairs
+def parse_sort_spec(spec):
+    keys = []
+    for field in spec.replace(" ", "").lower().split(","):
+        if not field:
+            continue
+        descending = field.startswith("-")
+        field = field.lstrip("-+")
+        if field not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort field '{field}'. Choose from {', '.join(SORT_FIELDS)}.")
+        keys.append((SORT_FIELDS.index(field), descending))
+    return keys or [(0, False)]
+
+# Build the key function of a compound sort; text fields use natural order when asked
+def record_key(sort_keys, natural=False):
+    def key(record):
+        parts = []
+        for index, descending in sort_keys:
+            value = record[index]
+            if isinstance(value, str):
+                value = natural_key(value)[0] if natural else value
+            parts.append(Descending(value) if descending else value)
+        # The path breaks ties, so equal keys still come out in a stable order
+        parts.append(record[0])
+        return parts
+    return key
+
+# Sort records with bounded memory. Records read back from spill files are lists rather than tuples.
+def sort_records(records, key, top=None):
+    # Top-K keeps only the best top records in a heap instead of sorting the whole listing
+    if top:
+        return heapq.nsmallest(top, records, key=key)
+    return external_sort(records, key)
+
+# Format a record as a TSV row or a JSONL object
+def format_record(record, output_format):
+    path, name, ext, size, mtime = record
+    modified = datetime.fromtimestamp(mtime / 1e9).isoformat(sep=" ", timespec="seconds")
+    if output_format == ".tsv":
+        # Tabs and line breaks inside a path would split the row, so they are written as \t and \n
+        path = path.replace("\t", "\\t").replace("\n", "\\n")
+        return "\t".join((path, ext, str(size), modified))
+    return json.dumps({"path": path, "name": name, "ext": ext, "size": size, "mtime": mtime, "modified": modified})
+
+if __name__ == "__main__":
+    # Ask the user for the folder path
+    folder_path = input("Enter the folder path: ")
+
+    # Ask whether to list subfolders too and whether digits should sort as numbers
+    recursive = input("Include subfolders? (yes/no): ").lower() == "yes"
+    natural = input("Natural sort order, so file2 comes before file10? (yes/no): ").lower() == "yes"
+
+    # Ask for the sort order and for an optional top-K limit
+    spec = input(f"Sort by ({', '.join(SORT_FIELDS)}; comma-separated, prefix - for descending, default path): ")
+    top = input("Keep only the first N entries (blank for all): ")
+    try:
+        sort_keys = parse_sort_spec(spec)
+        top = int(top) if top else None
+    except ValueError as e:
+        raise SystemExit(f"Invalid choice: {e}")
+
+    # Ask the user for the output file name (.txt for paths only, .tsv or .jsonl for metadata columns)
+    output_file = input("Enter the output file name (e.g., sorted_files.txt, sorted_files.tsv or sorted_files.jsonl): ")
+
+    # Add .txt extension if not provided by the user
+    output_format = os.path.splitext(output_file)[1].lower()
+    if output_format not in OUTPUT_FORMATS:
+        output_file += ".txt"
+        output_format = ".txt"
+
+    if sort_keys == [(0, False)] and not top and output_format == ".txt":
+        # Plain path listings skip the metadata and sort the paths themselves
+        file_list = external_sort(iter_paths(folder_path, recursive), key=natural_key if natural else None)
+    else:
+        records = sort_records(iter_records(folder_path, recursive), record_key(sort_keys, natural), top)
+        if output_format == ".txt":
+            file_list = (record[0] for record in records)
+        else:
+            file_list = (format_record(record, output_format) for record in records)
+    header = "\t".join(("path", "ext", "size", "modified")) if output_format == ".tsv" else None
+    count = write_lines(output_file, file_list, header)
+
+    print(f"List of {count} files has been sorted and saved to {output_file}.")
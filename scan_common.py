@@ -0,0 +1,414 @@
+# Database layout, filter rules and folder bookkeeping shared by DataSafari.py, DataSafari Enhanced.py
+# and FileFusion.py, which all read and write the same files table
+
+import os
+import re
+import fnmatch
+from collections import defaultdict
+
+# Version of the database layout written by these scripts, stored in PRAGMA user_version
+SCHEMA_VERSION = 4
+
+# Secondary indexes on the files table; bulk loads drop them and build them once the load is done
+SECONDARY_INDEXES = {
+    'idx_files_file_format': 'file_format',
+    'idx_files_size': 'size',
+    'idx_files_ctime': 'ctime',
+}
+
+# Layout of the files table: size in bytes, ctime/mtime/atime in integer nanoseconds since the epoch
+FILES_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS files (
+                    id INTEGER PRIMARY KEY,
+                    type TEXT,
+                    file_format TEXT,
+                    name TEXT,
+                    address TEXT,
+                    size INTEGER,
+                    ctime INTEGER,
+                    mtime INTEGER,
+                    atime INTEGER,
+                    parent TEXT,
+                    inode INTEGER,
+                    deleted INTEGER DEFAULT 0
+                )'''
+
+# Human-readable view of the files table, matching the KB sizes and date strings of older versions
+FILES_VIEW_SQL = '''CREATE VIEW IF NOT EXISTS files_view AS
+                    SELECT id, type, file_format, name, address, size / 1024 AS size_kb,
+                           datetime(ctime / 1000000000, 'unixepoch', 'localtime') AS created_date,
+                           datetime(mtime / 1000000000, 'unixepoch', 'localtime') AS modified_date,
+                           datetime(atime / 1000000000, 'unixepoch', 'localtime') AS accessed_date,
+                           parent, deleted
+                    FROM files'''
+
+# Function to add the columns and table used by incremental rescans (schema version 1)
+def migrate_to_v1(c):
+    columns = {row[1] for row in c.execute("PRAGMA table_info(files)")}
+    for column, column_type in (('parent', 'TEXT'), ('mtime', 'INTEGER'), ('inode', 'INTEGER'), ('deleted', 'INTEGER DEFAULT 0')):
+        if column not in columns:
+            c.execute(f"ALTER TABLE files ADD COLUMN {column} {column_type}")
+    if 'parent' not in columns:
+        c.execute("SELECT id, address FROM files")
+        c.executemany("UPDATE files SET parent=? WHERE id=?",
+                      [(os.path.dirname(address), row_id) for row_id, address in c.fetchall() if address])
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_parent ON files (parent)")
+    create_scanned_dirs_table(c)
+    # Record the folders already known, with no mtime, so the first rescan lists them and notices vanished ones
+    c.execute("SELECT DISTINCT parent FROM files WHERE parent IS NOT NULL")
+    folders = {}
+    for (folder,) in c.fetchall():
+        while folder not in folders:
+            parent = os.path.dirname(folder)
+            folders[folder] = parent if parent != folder else None
+            if folders[folder] is None:
+                break
+            folder = parent
+    c.executemany("INSERT OR IGNORE INTO scanned_dirs (address, parent, mtime) VALUES (?, ?, NULL)", folders.items())
+
+# Function to make address unique and add the secondary indexes (schema version 2)
+def migrate_to_v2(c):
+    # Older scans could record the same path more than once; keep the most recent row
+    c.execute("DELETE FROM files WHERE id NOT IN (SELECT MAX(id) FROM files GROUP BY address)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_files_address ON files (address)")
+    for index_name, column in (('idx_files_file_format', 'file_format'), ('idx_files_size', 'size'),
+                               ('idx_files_created_date', 'created_date')):
+        c.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON files ({column})")
+
+# Function to convert KB sizes and formatted creation dates to bytes and epoch nanoseconds (schema version 3)
+def migrate_to_v3(c):
+    for index_name in ('idx_files_address', 'idx_files_parent', 'idx_files_file_format', 'idx_files_size', 'idx_files_created_date'):
+        c.execute(f"DROP INDEX IF EXISTS {index_name}")
+    c.execute("ALTER TABLE files RENAME TO files_v2")
+    c.execute(FILES_TABLE_SQL)
+    # created_date was written in local time, so it is converted back to UTC before taking the epoch
+    c.execute("""INSERT INTO files (id, type, file_format, name, address, size, ctime, mtime, atime, parent, inode, deleted)
+                 SELECT id, type, file_format, name, address, size * 1024,
+                        CAST(strftime('%s', created_date, 'utc') AS INTEGER) * 1000000000, mtime, NULL, parent, inode, deleted
+                 FROM files_v2""")
+    c.execute("DROP TABLE files_v2")
+    create_indexes(c)
+    # Forget folder mtimes so the next update re-reads every folder and replaces the approximate values
+    c.execute("UPDATE scanned_dirs SET mtime=NULL")
+
+# Function to add the recursive folder totals table and compute it from the existing rows (schema version 4)
+def migrate_to_v4(c):
+    create_dir_stats_table(c)
+    rebuild_dir_stats(c)
+
+# Function to create the table of folder mtimes from the last scan, used to skip unchanged folders
+def create_scanned_dirs_table(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS scanned_dirs (
+                    address TEXT PRIMARY KEY,
+                    parent TEXT,
+                    mtime INTEGER
+                )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scanned_dirs_parent ON scanned_dirs (parent)")
+
+# Function to create the table of recursive folder totals: bytes and file count of every live file below
+# a folder, and the newest mtime seen below it
+def create_dir_stats_table(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS dir_stats (
+                    address TEXT PRIMARY KEY,
+                    parent TEXT,
+                    total_size INTEGER,
+                    file_count INTEGER,
+                    newest_mtime INTEGER
+                )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dir_stats_parent ON dir_stats (parent)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dir_stats_total_size ON dir_stats (total_size)")
+
+# Function to recompute dir_stats from the files table in one bottom-up pass
+def rebuild_dir_stats(c):
+    c.execute("""SELECT parent, SUM(size), COUNT(*), MAX(mtime) FROM files
+                 WHERE type='file' AND deleted=0 AND parent IS NOT NULL GROUP BY parent""")
+    stats = {parent: [size or 0, count, newest] for parent, size, count, newest in c.fetchall()}
+    # Every ancestor of a folder holding files gets a row, even if it holds no files itself
+    for folder in list(stats):
+        parent = os.path.dirname(folder)
+        while parent != folder and parent not in stats:
+            stats[parent] = [0, 0, None]
+            folder, parent = parent, os.path.dirname(parent)
+    # A parent path is always shorter than its children, so longest-first adds every folder into its parent
+    # only after all of its own children have been added into it
+    for folder in sorted(stats, key=len, reverse=True):
+        parent = os.path.dirname(folder)
+        if parent != folder:
+            size, count, newest = stats[folder]
+            totals = stats[parent]
+            totals[0] += size
+            totals[1] += count
+            if newest is not None and (totals[2] is None or newest > totals[2]):
+                totals[2] = newest
+    c.execute("DELETE FROM dir_stats")
+    c.executemany("INSERT INTO dir_stats (address, parent, total_size, file_count, newest_mtime) VALUES (?, ?, ?, ?, ?)",
+                  ((folder, parent if parent != folder else None, size, count, newest)
+                   for folder, parent, (size, count, newest) in ((f, os.path.dirname(f), v) for f, v in stats.items())))
+
+# Function to add a change in bytes and file count to a folder and all of its ancestors in dir_stats
+def apply_dir_stats_delta(c, dir_path, size_delta, count_delta, newest_mtime=None):
+    if not size_delta and not count_delta and newest_mtime is None:
+        return
+    folders = []
+    folder = dir_path
+    while True:
+        parent = os.path.dirname(folder)
+        folders.append((folder, parent if parent != folder else None))
+        if parent == folder:
+            break
+        folder = parent
+    c.executemany("INSERT OR IGNORE INTO dir_stats (address, parent, total_size, file_count, newest_mtime) VALUES (?, ?, 0, 0, NULL)",
+                  folders)
+    placeholders = ', '.join('?' * len(folders))
+    addresses = [folder for folder, parent in folders]
+    if newest_mtime is None:
+        c.execute(f"UPDATE dir_stats SET total_size=total_size+?, file_count=file_count+? WHERE address IN ({placeholders})",
+                  [size_delta, count_delta] + addresses)
+    else:
+        c.execute(f"UPDATE dir_stats SET total_size=total_size+?, file_count=file_count+?, "
+                  f"newest_mtime=MAX(COALESCE(newest_mtime, ?), ?) WHERE address IN ({placeholders})",
+                  [size_delta, count_delta, newest_mtime, newest_mtime] + addresses)
+
+# Function to create the indexes on the files table
+def create_indexes(c):
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_files_address ON files (address)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_parent ON files (parent)")
+    create_secondary_indexes(c)
+
+# Function to create the secondary indexes on the files table
+def create_secondary_indexes(c):
+    for index_name, column in SECONDARY_INDEXES.items():
+        c.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON files ({column})")
+
+MIGRATIONS = [migrate_to_v1, migrate_to_v2, migrate_to_v3, migrate_to_v4]
+
+# Insert a row, or refresh the existing row for the same address
+UPSERT_FILE_SQL = ("INSERT INTO files (type, file_format, name, address, size, ctime, mtime, atime, parent, inode, deleted) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0) "
+                   "ON CONFLICT(address) DO UPDATE SET type=excluded.type, file_format=excluded.file_format, "
+                   "name=excluded.name, size=excluded.size, ctime=excluded.ctime, mtime=excluded.mtime, "
+                   "atime=excluded.atime, parent=excluded.parent, inode=excluded.inode, deleted=0")
+
+# Function to create the 'files' table in the database and migrate older layouts to the current one
+def create_files_table(conn):
+    c = conn.cursor()
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='files'").fetchone():
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        for target_version, migrate in enumerate(MIGRATIONS, start=1):
+            if version < target_version:
+                migrate(c)
+    else:
+        version = 0
+        c.execute(FILES_TABLE_SQL)
+        create_indexes(c)
+        create_scanned_dirs_table(c)
+        create_dir_stats_table(c)
+    c.execute(FILES_VIEW_SQL)
+    if version < SCHEMA_VERSION:
+        c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+# Function to switch a connection to bulk-load settings and drop the secondary indexes until the load is done
+def begin_bulk_load(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")  # 256 MB page cache
+    conn.execute("PRAGMA temp_store=MEMORY")
+    for index_name in SECONDARY_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+    conn.commit()
+
+# Function to rebuild the secondary indexes and restore safe settings after a bulk load
+def end_bulk_load(conn):
+    create_secondary_indexes(conn.cursor())
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+
+# Function to build a database row from a stat result
+def make_row(entry_type, name, path, parent, st):
+    if entry_type == 'folder':
+        return ('folder', None, name, path, None, st.st_ctime_ns, st.st_mtime_ns, st.st_atime_ns, parent, st.st_ino)
+    return ('file', os.path.splitext(name)[-1].lower(), name, path, st.st_size,
+            st.st_ctime_ns, st.st_mtime_ns, st.st_atime_ns, parent, st.st_ino)
+
+# Exclusions applied when no rules file is given
+DEFAULT_FILTER_RULES = [
+    ('exclude-dir', '$RECYCLE.BIN'),
+    ('exclude-dir', '$IQY2E5Z'),
+    ('exclude-ext', '.ini'),
+    ('exclude-ext', '.tmp'),
+]
+
+# Rule keywords accepted in a filter rules file
+FILTER_KEYWORDS = ('include', 'exclude', 'include-ext', 'exclude-ext', 'exclude-dir')
+
+# Function to read filter rules from a file, one "<keyword> <pattern>" pair per line
+def load_filter_rules(rules_path):
+    rules = []
+    with open(rules_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            keyword, _, pattern = line.partition(' ')
+            pattern = pattern.strip()
+            if keyword not in FILTER_KEYWORDS or not pattern:
+                raise ValueError(f"{rules_path}, line {line_number}: expected one of {', '.join(FILTER_KEYWORDS)} "
+                                 f"followed by a pattern")
+            rules.append((keyword, pattern))
+    return rules
+
+# Function to ask for an optional rules file, falling back to the given rules when left blank
+def prompt_filter_rules(default_rules=()):
+    blank_choice = "the defaults" if default_rules else "none"
+    while True:
+        rules_path = input(f"Filter rules file (leave blank for {blank_choice}): ").strip()
+        if not rules_path:
+            return list(default_rules)
+        try:
+            return load_filter_rules(rules_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not read the rules file: {e}")
+
+# Function to join glob patterns into one compiled regex, or None when there are none
+def compile_globs(patterns):
+    if not patterns:
+        return None
+    flags = re.IGNORECASE if os.name == 'nt' else 0
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns), flags)
+
+# Function to compile filter rules once into extension sets and combined regexes
+def compile_filter(rules):
+    groups = defaultdict(list)
+    for keyword, pattern in rules:
+        groups[keyword].append(pattern)
+    exts = {keyword: {('' if ext.startswith('.') else '.') + ext.lower() for ext in groups[keyword]}
+            for keyword in ('include-ext', 'exclude-ext')}
+    # Plain folder names are a set lookup; only names with wildcards go through the regex
+    dir_globs = [pattern for pattern in groups['exclude-dir'] if any(ch in pattern for ch in '*?[')]
+    return {
+        'include_exts': exts['include-ext'],
+        'exclude_exts': exts['exclude-ext'],
+        'include_re': compile_globs(groups['include']),
+        'exclude_re': compile_globs(groups['exclude']),
+        'exclude_dir_names': {os.path.normcase(pattern) for pattern in groups['exclude-dir']
+                              if pattern not in dir_globs},
+        'exclude_dir_re': compile_globs(dir_globs),
+    }
+
+# Function to check a file name against a compiled filter before the file is stat'ed
+def file_allowed(file_filter, name):
+    if file_filter is None:
+        return True
+    ext = os.path.splitext(name)[-1].lower()
+    if ext in file_filter['exclude_exts']:
+        return False
+    if file_filter['exclude_re'] and file_filter['exclude_re'].match(name):
+        return False
+    if file_filter['include_exts'] or file_filter['include_re']:
+        return ext in file_filter['include_exts'] or bool(file_filter['include_re'] and file_filter['include_re'].match(name))
+    return True
+
+# Function to check a folder name against a compiled filter so excluded trees are never descended
+def dir_allowed(file_filter, name):
+    if file_filter is None:
+        return True
+    if os.path.normcase(name) in file_filter['exclude_dir_names']:
+        return False
+    return not (file_filter['exclude_dir_re'] and file_filter['exclude_dir_re'].match(name))
+
+# Function to list a single directory, returning (name, path, is_dir, stat) for every entry
+def list_directory(dir_path, file_filter=None):
+    entries = []
+    try:
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                try:
+                    # Filtering happens before entry.stat(), so excluded entries cost no stat call
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if is_dir:
+                        if not dir_allowed(file_filter, entry.name):
+                            continue
+                    elif not file_allowed(file_filter, entry.name):
+                        continue
+                    entries.append((entry.name, entry.path, is_dir, entry.stat()))
+                except OSError:
+                    pass  # Ignore error and continue
+    except OSError:
+        pass  # Ignore error and continue
+    return entries
+
+# Function to return the (low, high) address range holding everything below a directory
+def subtree_bounds(dir_path):
+    # Children of dir_path sort between "dir_path/" and the next character after the separator
+    prefix = dir_path if dir_path.endswith(os.sep) else dir_path + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+# Function to mark every row below a vanished directory as deleted
+def mark_subtree_deleted(c, dir_path):
+    low, high = subtree_bounds(dir_path)
+    row = c.execute("SELECT total_size, file_count FROM dir_stats WHERE address=?", (dir_path,)).fetchone()
+    if row:
+        apply_dir_stats_delta(c, os.path.dirname(dir_path), -row[0], -row[1])
+    c.execute("DELETE FROM dir_stats WHERE address=? OR (address>=? AND address<?)", (dir_path, low, high))
+    c.execute("UPDATE files SET deleted=1 WHERE address=? OR (address>=? AND address<?)", (dir_path, low, high))
+    c.execute("DELETE FROM scanned_dirs WHERE address=? OR (address>=? AND address<?)", (dir_path, low, high))
+
+# Function to bring the rows of one directory in line with its current listing
+def reconcile_directory(c, dir_path, dir_mtime, entries, include_subfolders, update_dir_stats=True):
+    c.execute("SELECT id, type, name, size, mtime, inode, deleted, atime FROM files WHERE parent=?", (dir_path,))
+    known = {row[2]: row for row in c.fetchall()}
+    c.execute("SELECT address FROM scanned_dirs WHERE parent=?", (dir_path,))
+    known_dirs = {row[0] for row in c.fetchall()}
+    changed = 0
+    size_delta = count_delta = 0
+    newest_mtime = None
+    seen = set()
+    subdirs = []
+    for name, path, is_dir, st in entries:
+        seen.add(name)
+        if is_dir:
+            subdirs.append((path, st.st_mtime_ns))
+            if not include_subfolders:
+                continue
+        row = make_row('folder' if is_dir else 'file', name, path, dir_path, st)
+        old = known.get(name)
+        if old is None:
+            c.execute(UPSERT_FILE_SQL, row)
+            changed += 1
+        # Rows converted from the KB/date-string layout have no atime and are refreshed from the new stat
+        elif old[1] != row[0] or old[3] != row[4] or old[4] != row[6] or old[5] != row[9] or old[6] or old[7] is None:
+            c.execute("UPDATE files SET type=?, file_format=?, name=?, address=?, size=?, ctime=?, mtime=?, atime=?, parent=?, inode=?, deleted=0 "
+                      "WHERE id=?", row + (old[0],))
+            changed += 1
+        else:
+            continue
+        if old is not None and old[1] == 'file' and not old[6]:
+            size_delta -= old[3] or 0
+            count_delta -= 1
+        if row[0] == 'file':
+            size_delta += row[4]
+            count_delta += 1
+            newest_mtime = max(newest_mtime or row[6], row[6])
+    for name, old in known.items():
+        if name not in seen and not old[6]:
+            c.execute("UPDATE files SET deleted=1 WHERE id=?", (old[0],))
+            changed += 1
+            if old[1] == 'file':
+                size_delta -= old[3] or 0
+                count_delta -= 1
+    if update_dir_stats:
+        apply_dir_stats_delta(c, dir_path, size_delta, count_delta, newest_mtime)
+    for vanished_dir in known_dirs.difference(path for path, mtime in subdirs):
+        mark_subtree_deleted(c, vanished_dir)
+    parent = os.path.dirname(dir_path)
+    c.execute("INSERT OR REPLACE INTO scanned_dirs (address, parent, mtime) VALUES (?, ?, ?)",
+              (dir_path, parent if parent != dir_path else None, dir_mtime))
+    return subdirs, changed
+
+# Function to format a byte count for display
+def format_size(num_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if num_bytes < 1024 or unit == 'TB':
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
@@ -0,0 +1,72 @@
+import re
+import json
+import heapq
+import itertools
+import tempfile
+
+# Entries sorted in memory at once; longer listings are sorted in runs spilled to temporary files and merged
+SORT_CHUNK_LINES = 500000
+
+# Buffer size of the output file and of the spill files
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Compare digit runs as numbers, so "file2" sorts before "file10"; text parts ignore case
+def natural_key(name):
+    parts = re.split(r"(\d+)", name)
+    return [int(part) if i % 2 else part.casefold() for i, part in enumerate(parts)], name
+
+# Sort one run and spill it to a temporary file, one JSON value per line, so names holding line breaks
+# come back whole
+def write_run(lines, key):
+    lines.sort(key=key)
+    run = tempfile.TemporaryFile("w+", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+    run.writelines(json.dumps(line) + "\n" for line in lines)
+    run.seek(0)
+    return run
+
+# Sort any number of lines with bounded memory: runs of chunk_lines are sorted and spilled, then merged.
+# Listings that fit in one run never touch the disk. Lines read back from spill files come back as
+# JSON values, so tuples become lists.
+def external_sort(lines, key=None, chunk_lines=SORT_CHUNK_LINES):
+    runs = []
+    chunk = []
+    try:
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                runs.append(write_run(chunk, key))
+                chunk = []
+        if not runs:
+            chunk.sort(key=key)
+            yield from chunk
+            return
+        if chunk:
+            runs.append(write_run(chunk, key))
+            chunk = []
+        yield from heapq.merge(*((json.loads(line) for line in run) for run in runs), key=key)
+    finally:
+        for run in runs:
+            run.close()
+
+# Write lines in batches through a large buffer instead of one write call per line, after an optional
+# header line. Returns the number of lines written, not counting the header.
+def write_lines(path, lines, header=None, batch_lines=10000):
+    # Start the listing before the output file exists, so it never lists itself
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is not None:
+        lines = itertools.chain([first], lines)
+    count = 0
+    with open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+        if header is not None:
+            f.write(header + "\n")
+        batch = []
+        for line in lines:
+            batch.append(line + "\n")
+            if len(batch) >= batch_lines:
+                f.writelines(batch)
+                count += len(batch)
+                batch = []
+        f.writelines(batch)
+        count += len(batch)
+    return count
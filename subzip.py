@@ -1,58 +1,398 @@
 import os
+import time
+import zlib
+import sqlite3
 import zipfile
 import shutil
+import concurrent.futures
 
-# Function to extract ZIP files into folders based on the folder name extracted from the file name
-def extract_zip_files(directory):
-    # Create a dictionary to store destination directories
-    dest_dirs = {}
+# Number of archive groups extracted at the same time
+EXTRACT_WORKERS = os.cpu_count() or 1
+
+# Bytes copied per read when streaming a member out of an archive
+CHUNK_SIZE = 1024 * 1024
+
+# Journal recording each archive's size, mtime, CRC and extraction state, kept next to the archives
+JOURNAL_NAME = "subzip_journal.db"
+
+# Seconds between directory checks in watch mode
+WATCH_INTERVAL = 5
 
-    # Iterate through each file in the directory
-    for filename in os.listdir(directory):
+# Extraction attempts made on an unchanged archive before it is left alone until its size or mtime changes
+MAX_ATTEMPTS = 3
+
+# Function to get the folder name from the part of the file name before "_farsi_persian"
+def folder_name_for(filename):
+    return filename.split("_farsi_persian")[0].replace("-", " ").title()
+
+# Function to group the ZIP files of a directory by the folder they extract into
+def group_zip_files(directory):
+    groups = {}
+    for filename in sorted(os.listdir(directory)):
         if filename.endswith(".zip"):
-            # Extract the folder name before "_farsi_persian"
-            folder_name = filename.split("_farsi_persian")[0].replace("-", " ").title()
-            dest_dir = os.path.join(directory, folder_name)
-            # Check if the directory already exists
-            if not os.path.exists(dest_dir):
-                os.makedirs(dest_dir)
-            # Extract the ZIP file into the folder
-            with zipfile.ZipFile(os.path.join(directory, filename), 'r') as zip_ref:
-                zip_ref.extractall(dest_dir)
-            # Store the destination directory in the dictionary
-            dest_dirs[folder_name] = dest_dir
-
-    return dest_dirs
-
-# Function to move all extracted folders to a directory named "extracted"
-def move_folders_to_extracted(directory, dest_dirs):
-    # Create the "extracted" directory if it doesn't exist
+            groups.setdefault(folder_name_for(filename), []).append(os.path.join(directory, filename))
+    return groups
+
+# Function to compute the CRC-32 of a file, reading it in chunks
+def file_crc32(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+# Function to open the extraction journal of a directory
+def open_journal(directory):
+    conn = sqlite3.connect(os.path.join(directory, JOURNAL_NAME))
+    conn.execute('''CREATE TABLE IF NOT EXISTS archives (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER,
+                        mtime INTEGER,
+                        crc INTEGER,
+                        state TEXT
+                    )''')
+    # Journals written before failed archives were retried have no attempt count
+    if 'attempts' not in {row[1] for row in conn.execute("PRAGMA table_info(archives)")}:
+        conn.execute("ALTER TABLE archives ADD COLUMN attempts INTEGER DEFAULT 0")
+    conn.commit()
+    return conn
+
+# Function to pick the archives that still need extracting, as (path, size, mtime, attempts so far).
+# Archives finished with the same size and mtime are skipped without reading them; a changed mtime with
+# the same size is checked by CRC, so a re-downloaded copy of a finished archive is skipped too. Failed
+# archives are retried like partial ones until MAX_ATTEMPTS attempts on the same size and mtime have failed.
+def pending_archives(journal, groups, only=None):
+    known = {path: (size, mtime, crc, state, attempts)
+             for path, size, mtime, crc, state, attempts in journal.execute("SELECT path, size, mtime, crc, state, attempts FROM archives")}
+    pending = {}
+    skipped = 0
+    given_up = 0
+    for folder_name, zip_paths in groups.items():
+        for zip_path in zip_paths:
+            if only is not None and zip_path not in only:
+                continue
+            try:
+                st = os.stat(zip_path)
+                size, mtime, crc, state, attempts = known.get(zip_path, (None, None, None, None, 0))
+                unchanged = size == st.st_size and mtime == st.st_mtime_ns
+                if state == 'done' and size == st.st_size:
+                    if unchanged:
+                        skipped += 1
+                        continue
+                    if crc is not None and file_crc32(zip_path) == crc:
+                        journal.execute("UPDATE archives SET mtime=? WHERE path=?", (st.st_mtime_ns, zip_path))
+                        skipped += 1
+                        continue
+                if state == 'failed' and unchanged and (attempts or 0) >= MAX_ATTEMPTS:
+                    given_up += 1
+                    continue
+            except OSError:
+                continue  # The archive vanished since the directory was listed
+            pending.setdefault(folder_name, []).append((zip_path, st.st_size, st.st_mtime_ns,
+                                                        (attempts or 0) if unchanged else 0))
+    journal.commit()
+    return pending, skipped, given_up
+
+# Function to tell whether a member was already written with the same size and CRC, as after an interrupted run
+def member_already_written(target, info):
+    try:
+        return os.path.getsize(target) == info.file_size and file_crc32(target) == info.CRC
+    except OSError:
+        return False
+
+# Function to resolve where a member is written, refusing names that would escape the destination folder
+def member_target(dest_dir, member_name):
+    target = os.path.normpath(os.path.join(dest_dir, member_name))
+    if os.path.commonpath([os.path.abspath(dest_dir), os.path.abspath(target)]) != os.path.abspath(dest_dir):
+        raise ValueError(f"Unsafe member name: {member_name}")
+    return target
+
+# Function to list what an extraction would write without writing anything: target folders, total
+# uncompressed bytes, and files written by more than one archive or already present on disk
+def plan_extraction(directory):
+    extracted_dir = os.path.join(directory, "extracted")
+    plan = {'folders': {}, 'total_bytes': 0, 'collisions': [], 'errors': []}
+    for folder_name, zip_paths in group_zip_files(directory).items():
+        dest_dir = os.path.join(extracted_dir, folder_name)
+        written_by = {}
+        folder_bytes = 0
+        for zip_path in zip_paths:
+            try:
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    for info in zip_ref.infolist():
+                        if info.is_dir():
+                            continue
+                        target = member_target(dest_dir, info.filename)
+                        if target in written_by:
+                            plan['collisions'].append((target, written_by[target], zip_path))
+                        elif os.path.exists(target):
+                            plan['collisions'].append((target, "existing file", zip_path))
+                        written_by[target] = zip_path
+                        folder_bytes += info.file_size
+            except (zipfile.BadZipFile, ValueError, OSError) as e:
+                plan['errors'].append((zip_path, str(e)))
+        plan['folders'][folder_name] = (dest_dir, len(zip_paths), folder_bytes)
+        plan['total_bytes'] += folder_bytes
+    return plan
+
+# Function to stream one member of an archive to its target file
+def write_member(zip_ref, info, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with zip_ref.open(info) as source, open(target, 'wb') as destination:
+        shutil.copyfileobj(source, destination, CHUNK_SIZE)
+
+# Function to extract a group of archives into their final folder, streaming each member in chunks.
+# Archives of one group run in order, so when two write the same file the later archive wins. Members
+# already on disk with the right size and CRC are left alone, which resumes an interrupted archive.
+# Returns (zip_path, crc, members written, bytes written, error) for each archive.
+def extract_group(zip_paths, dest_dir):
+    results = []
+    for zip_path in zip_paths:
+        members = 0
+        total_bytes = 0
+        try:
+            crc = file_crc32(zip_path)
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                for info in zip_ref.infolist():
+                    target = member_target(dest_dir, info.filename)
+                    if info.is_dir():
+                        os.makedirs(target, exist_ok=True)
+                        continue
+                    if member_already_written(target, info):
+                        continue
+                    write_member(zip_ref, info, target)
+                    members += 1
+                    total_bytes += info.file_size
+            results.append((zip_path, crc, members, total_bytes, None))
+        except (zipfile.BadZipFile, ValueError, OSError) as e:
+            results.append((zip_path, None, members, total_bytes, str(e)))
+    return results
+
+# Function to extract ZIP files straight into extracted/<Folder Name>, one process per group of archives.
+# The journal marks archives partial before they start and done once written, so a rerun skips finished
+# archives and resumes partial ones. only limits the run to the given archive paths.
+def extract_zip_files(directory, workers=EXTRACT_WORKERS, only=None):
     extracted_dir = os.path.join(directory, "extracted")
     os.makedirs(extracted_dir, exist_ok=True)
+    journal = open_journal(directory)
+    pending, skipped, given_up = pending_archives(journal, group_zip_files(directory), only)
     
-    # Move all extracted folders to the "extracted" directory
-    for folder_name, dest_dir in dest_dirs.items():
-        shutil.move(dest_dir, extracted_dir)
-    
-    return extracted_dir
+    # Create a dictionary to store destination directories
+    dest_dirs = {}
+    stats = {'archives': 0, 'skipped': skipped, 'members': 0, 'bytes': 0, 'failed': 0, 'given_up': given_up}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for folder_name, archives in pending.items():
+            journal.executemany("INSERT OR REPLACE INTO archives (path, size, mtime, crc, state, attempts) "
+                                "VALUES (?, ?, ?, NULL, 'partial', ?)", archives)
+            journal.commit()
+            dest_dir = os.path.join(extracted_dir, folder_name)
+            zip_paths = [zip_path for zip_path, size, mtime, attempts in archives]
+            futures[executor.submit(extract_group, zip_paths, dest_dir)] = (folder_name, dest_dir)
+        for future in concurrent.futures.as_completed(futures):
+            folder_name, dest_dir = futures[future]
+            for zip_path, crc, members, total_bytes, error in future.result():
+                if error:
+                    print(f"Error extracting {zip_path}: {error}")
+                    stats['failed'] += 1
+                else:
+                    dest_dirs[folder_name] = dest_dir
+                    stats['archives'] += 1
+                stats['members'] += members
+                stats['bytes'] += total_bytes
+                journal.execute("UPDATE archives SET crc=?, state=?, attempts=attempts + ? WHERE path=?",
+                                (crc, 'failed' if error else 'done', 1 if error else 0, zip_path))
+            journal.commit()
+    journal.close()
+
+    return dest_dirs, stats
+
+# Function to create the tables of the archive index, kept in the journal database
+def create_index_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS indexed_archives (
+                        path TEXT PRIMARY KEY,
+                        name TEXT,
+                        folder TEXT,
+                        size INTEGER,
+                        mtime INTEGER
+                    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS members (
+                        archive TEXT,
+                        name TEXT,
+                        file_size INTEGER,
+                        compress_size INTEGER,
+                        crc INTEGER,
+                        PRIMARY KEY (archive, name)
+                    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_members_name ON members (name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_indexed_archives_folder ON indexed_archives (folder)")
+    conn.commit()
+
+# Function to index the members of every archive from its central directory, without decompressing
+# anything. Archives whose size and mtime are unchanged since the last run are not opened.
+def index_archives(directory):
+    conn = open_journal(directory)
+    create_index_tables(conn)
+    known = {path: (size, mtime) for path, size, mtime in conn.execute("SELECT path, size, mtime FROM indexed_archives")}
+    stats = {'indexed': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+    present = set()
+    for folder_name, zip_paths in group_zip_files(directory).items():
+        for zip_path in zip_paths:
+            try:
+                st = os.stat(zip_path)
+            except OSError:
+                continue  # The archive vanished since the directory was listed
+            present.add(zip_path)
+            if known.get(zip_path) == (st.st_size, st.st_mtime_ns):
+                stats['unchanged'] += 1
+                continue
+            try:
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    rows = [(zip_path, info.filename, info.file_size, info.compress_size, info.CRC)
+                            for info in zip_ref.infolist() if not info.is_dir()]
+            except (zipfile.BadZipFile, OSError) as e:
+                print(f"Error indexing {zip_path}: {e}")
+                stats['failed'] += 1
+                continue
+            conn.execute("DELETE FROM members WHERE archive=?", (zip_path,))
+            conn.executemany("INSERT OR REPLACE INTO members (archive, name, file_size, compress_size, crc) VALUES (?, ?, ?, ?, ?)",
+                             rows)
+            conn.execute("INSERT OR REPLACE INTO indexed_archives (path, name, folder, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                         (zip_path, os.path.basename(zip_path), folder_name, st.st_size, st.st_mtime_ns))
+            stats['indexed'] += 1
+    # Forget archives that are no longer in the directory
+    for zip_path in set(known) - present:
+        conn.execute("DELETE FROM members WHERE archive=?", (zip_path,))
+        conn.execute("DELETE FROM indexed_archives WHERE path=?", (zip_path,))
+        stats['removed'] += 1
+    conn.commit()
+    conn.close()
+    return stats
+
+# Function to search the index by member name, archive name or folder. The pattern may use * and ?
+# wildcards; without them it matches anywhere in the name. Matching ignores case.
+def search_index(directory, pattern):
+    like = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    like = like.replace('*', '%').replace('?', '_') if any(char in pattern for char in '*?') else f"%{like}%"
+    conn = open_journal(directory)
+    create_index_tables(conn)
+    rows = conn.execute("""SELECT a.folder, m.archive, m.name, m.file_size, m.crc
+                           FROM members m JOIN indexed_archives a ON a.path = m.archive
+                           WHERE m.name LIKE ? ESCAPE '\\' OR a.name LIKE ? ESCAPE '\\' OR a.folder LIKE ? ESCAPE '\\'
+                           ORDER BY a.folder, m.archive, m.name""", (like, like, like)).fetchall()
+    conn.close()
+    return rows
+
+# Function to extract only the given members, as returned by search_index, into extracted/<Folder Name>
+def extract_members(directory, matches):
+    extracted_dir = os.path.join(directory, "extracted")
+    by_archive = {}
+    for folder_name, zip_path, name, file_size, crc in matches:
+        by_archive.setdefault((zip_path, folder_name), set()).add(name)
+    written = 0
+    for (zip_path, folder_name), names in sorted(by_archive.items()):
+        dest_dir = os.path.join(extracted_dir, folder_name)
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                for info in zip_ref.infolist():
+                    if info.filename in names:
+                        target = member_target(dest_dir, info.filename)
+                        if not member_already_written(target, info):
+                            write_member(zip_ref, info, target)
+                        written += 1
+        except (zipfile.BadZipFile, ValueError, OSError) as e:
+            print(f"Error extracting {zip_path}: {e}")
+    return written
+
+# Function to keep extracting archives as they arrive. An archive is picked up once its size and mtime
+# are the same on two checks in a row, so a download still being written is left alone.
+def watch_directory(directory, interval=WATCH_INTERVAL, workers=EXTRACT_WORKERS):
+    print(f"Watching {directory} for new ZIP archives. Press Ctrl+C to stop.")
+    previous = {}
+    try:
+        while True:
+            current = {}
+            for zip_paths in group_zip_files(directory).values():
+                for zip_path in zip_paths:
+                    try:
+                        st = os.stat(zip_path)
+                    except OSError:
+                        continue
+                    current[zip_path] = (st.st_size, st.st_mtime_ns)
+            stable = {zip_path for zip_path, signature in current.items() if previous.get(zip_path) == signature}
+            if stable:
+                dest_dirs, stats = extract_zip_files(directory, workers, stable)
+                if stats['archives'] or stats['failed']:
+                    print(f"{stats['archives']} new archives extracted ({stats['members']} files), {stats['failed']} failed.")
+            previous = current
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+# Function to format a byte count for display
+def format_size(num_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if num_bytes < 1024 or unit == 'TB':
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+# Function to print an extraction plan
+def print_plan(plan):
+    for folder_name, (dest_dir, archive_count, folder_bytes) in sorted(plan['folders'].items()):
+        print(f"{dest_dir}  ({archive_count} archives, {format_size(folder_bytes)})")
+    print(f"{len(plan['folders'])} folders, {format_size(plan['total_bytes'])} uncompressed in total.")
+    for target, first, second in plan['collisions']:
+        print(f"Collision: {target} is written by {second} and by {first}")
+    for zip_path, error in plan['errors']:
+        print(f"Unreadable archive: {zip_path} ({error})")
 
 # Main function
 def main():
     # Prompt the user to input the directory containing .zip files
     directory = input("Enter the directory containing .zip files: ")
-
-    # Extract ZIP files into folders based on the folder name extracted from the file name
-    dest_dirs = extract_zip_files(directory)
     
-    # Move all extracted folders to a directory named "extracted"
-    extracted_dir = move_folders_to_extracted(directory, dest_dirs)
+    # Search the archive index and extract only the matching files
+    if input("Search inside the archives instead of extracting everything? (yes/no): ").lower() == 'yes':
+        stats = index_archives(directory)
+        print(f"Index updated: {stats['indexed']} archives read, {stats['unchanged']} unchanged, "
+              f"{stats['removed']} removed, {stats['failed']} failed.")
+        while True:
+            pattern = input("Enter a file name, language or pattern to search for (blank to stop): ").strip()
+            if not pattern:
+                break
+            matches = search_index(directory, pattern)
+            for folder_name, zip_path, name, file_size, crc in matches:
+                print(f"{folder_name} | {os.path.basename(zip_path)} | {name} | {format_size(file_size)}")
+            print(f"{len(matches)} files in {len({match[1] for match in matches})} archives match.")
+            if matches and input("Extract only the matching files? (yes/no): ").lower() == 'yes':
+                print(f"{extract_members(directory, matches)} files extracted.")
+        return
+    
+    # Show what would be written before anything is extracted
+    if input("Dry run (only show the plan)? (yes/no): ").lower() == 'yes':
+        print_plan(plan_extraction(directory))
+        return
+    
+    # Watch mode extracts archives as they arrive until interrupted
+    if input("Watch the directory for new archives? (yes/no): ").lower() == 'yes':
+        watch_directory(directory)
+        return
+
+    # Extract ZIP files straight into extracted/<Folder Name>
+    dest_dirs, stats = extract_zip_files(directory)
+    extracted_dir = os.path.join(directory, "extracted")
     
     # Count the number of ZIP archives extracted and the actual number of folders created
-    num_zip_archives = len(dest_dirs)
+    num_zip_archives = stats['archives']
     num_folders_created = len(os.listdir(extracted_dir))
     
     # Display success message with the actual number of folders created
     print(f"{num_zip_archives} ZIP Archives extracted in {num_folders_created} folders in {extracted_dir}.")
+    print(f"{stats['members']} files written ({format_size(stats['bytes'])}), {stats['skipped']} archives already done, "
+          f"{stats['failed']} archives failed.")
+    if stats['given_up']:
+        print(f"{stats['given_up']} archives failed {MAX_ATTEMPTS} times and were not retried; "
+              f"they are tried again once their size or modification time changes.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,127 @@
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import CineVault
+
+
+class CreateVideoTableTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.addCleanup(self.conn.close)
+
+    def make_old_schema(self):
+        """Build the video table as written before sizes were stored in bytes."""
+        self.conn.execute("""
+            CREATE TABLE video (
+                id INTEGER PRIMARY KEY,
+                file_name TEXT,
+                directory TEXT,
+                file_size_mb INTEGER
+            )
+        """)
+        self.conn.executemany("INSERT INTO video (file_name, directory, file_size_mb) VALUES (?, ?, ?)", [
+            ("a.mkv", os.path.join("no_such_dir", "movies"), 700),
+            # Older scans stored the full file path as the directory
+            ("b.mp4", os.path.join("no_such_dir", "movies", "b.mp4"), 2),
+            ("a.mkv", os.path.join("no_such_dir", "movies"), 700),
+        ])
+        self.conn.commit()
+
+    def columns(self, table):
+        return {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+
+    def test_migrates_mb_sizes_to_bytes(self):
+        self.make_old_schema()
+        CineVault.create_video_table(self.conn)
+        rows = self.conn.execute("SELECT file_name, directory, file_size FROM video ORDER BY file_name").fetchall()
+        movies = os.path.join("no_such_dir", "movies")
+        self.assertEqual(rows, [("a.mkv", movies, 700 * 1048576), ("b.mp4", movies, 2 * 1048576)])
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        self.assertNotIn("video_mb", tables)
+        self.assertNotIn("file_size_mb", self.columns("video"))
+        self.assertTrue({column for column, column_type in CineVault.PROBE_COLUMNS} <= self.columns("video"))
+
+    def test_migration_is_idempotent(self):
+        self.make_old_schema()
+        CineVault.create_video_table(self.conn)
+        CineVault.create_video_table(self.conn)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM video").fetchone()[0], 2)
+
+    def test_creates_new_table(self):
+        CineVault.create_video_table(self.conn)
+        self.assertTrue({"file_name", "directory", "file_size", "ctime", "mtime"} <= self.columns("video"))
+        indexes = {row[1] for row in self.conn.execute("PRAGMA index_list(video)")}
+        self.assertIn("idx_video_directory_file_name", indexes)
+
+
+class MultiIndexHashTest(unittest.TestCase):
+    def test_matches_brute_force_per_frame_threshold(self):
+        rng = random.Random(1)
+        videos = []
+        for video_id in range(500):
+            if video_id % 5 == 1:
+                # A near-duplicate of the previous video, some frames of it beyond the threshold
+                videos.append(tuple(frame_hash ^ sum(1 << bit for bit in rng.sample(range(64), rng.randint(0, 13)))
+                                    for frame_hash in videos[-1]))
+            else:
+                videos.append(tuple(rng.getrandbits(64) for frame in range(3)))
+        index = CineVault.MultiIndexHash(3, 10, len(videos))
+        found = set()
+        for video_id, frame_hashes in enumerate(videos):
+            found.update((match_id, video_id) for distances, match_id in index.search(frame_hashes))
+            index.add(frame_hashes, video_id)
+        expected = {(a, b) for b in range(len(videos)) for a in range(b)
+                    if all(CineVault.hamming_distance(x, y) <= 10 for x, y in zip(videos[a], videos[b]))}
+        self.assertTrue(expected)
+        self.assertEqual(found, expected)
+
+    def test_split_signature(self):
+        self.assertEqual(CineVault.split_signature(1 << 64 | 2, 2), (1, 2))
+
+
+class HashVideoTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def write_video(self, name, seed, size=(160, 120)):
+        import cv2
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        scenes = [cv2.resize(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8), size, interpolation=cv2.INTER_CUBIC)
+                  for scene in range(6)]
+        path = os.path.join(self.root, name)
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, size)
+        for frame in range(120):
+            writer.write(scenes[frame // 20])
+        writer.release()
+        return path
+
+    def signature(self, path):
+        signature, error = CineVault.hash_video(path)
+        self.assertIsNone(error)
+        return int(signature, 16)
+
+    def test_resized_copy_hashes_close(self):
+        original = self.signature(self.write_video("original.mp4", 1))
+        resized = self.signature(self.write_video("resized.mkv", 1, (96, 72)))
+        other = self.signature(self.write_video("other.mp4", 2))
+        self.assertLessEqual(CineVault.hamming_distance(original, resized), CineVault.PHASH_DISTANCE)
+        self.assertGreater(CineVault.hamming_distance(original, other), CineVault.PHASH_DISTANCE * CineVault.PHASH_FRAMES)
+
+    def test_unreadable_file(self):
+        path = os.path.join(self.root, "broken.mp4")
+        with open(path, "wb") as f:
+            f.write(b"not a video")
+        self.assertIsNone(CineVault.hash_video(path)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
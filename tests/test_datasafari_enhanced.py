@@ -0,0 +1,81 @@
+import importlib.util
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+from tqdm import tqdm
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import scan_common
+
+spec = importlib.util.spec_from_file_location("datasafari_enhanced", os.path.join(REPO_DIR, "DataSafari Enhanced.py"))
+datasafari_enhanced = importlib.util.module_from_spec(spec)
+# Registered so the update's process pool can pickle the module's functions by name
+sys.modules[spec.name] = datasafari_enhanced
+spec.loader.exec_module(datasafari_enhanced)
+
+
+class ScanDriveTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.db_path = os.path.join(self.root, "scan.db")
+        self.tree = os.path.join(self.root, "tree")
+        os.makedirs(os.path.join(self.tree, "sub"))
+        for name, size in (("keep.txt", 10), ("gone.txt", 100), (os.path.join("sub", "s.txt"), 1000)):
+            with open(os.path.join(self.tree, name), "wb") as f:
+                f.write(b"x" * size)
+        conn = sqlite3.connect(self.db_path)
+        scan_common.create_files_table(conn)
+        conn.close()
+
+    def scan(self):
+        totals, interrupted = datasafari_enhanced.scan_drive(self.db_path, self.tree, True, 2, tqdm(disable=True))
+        self.assertFalse(interrupted)
+        return totals
+
+    def query(self, sql, *args):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+
+    def test_rescan_marks_removed_file_deleted(self):
+        self.scan()
+        os.remove(os.path.join(self.tree, "gone.txt"))
+        self.scan()
+        rows = dict(self.query("SELECT name, deleted FROM files WHERE type='file'"))
+        self.assertEqual(rows, {"keep.txt": 0, "gone.txt": 1, "s.txt": 0})
+        self.assertEqual(self.query("SELECT total_size, file_count FROM dir_stats WHERE address=?", self.tree),
+                         [(1010, 2)])
+
+    def test_update_after_scan_skips_unchanged_folders(self):
+        self.scan()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            stats = datasafari_enhanced.update_database_for_drives(conn, self.db_path, [self.tree], True, [], False, 1)
+        finally:
+            conn.close()
+        self.assertEqual((stats['listed'], stats['skipped']), (0, 2))
+
+    def test_update_notices_vanished_subfolder(self):
+        self.scan()
+        shutil.rmtree(os.path.join(self.tree, "sub"))
+        conn = sqlite3.connect(self.db_path)
+        try:
+            datasafari_enhanced.update_database_for_drives(conn, self.db_path, [self.tree], True, [], False, 1)
+        finally:
+            conn.close()
+        self.assertEqual(self.query("SELECT deleted FROM files WHERE name='s.txt'"), [(1,)])
+        self.assertEqual(self.query("SELECT total_size, file_count FROM dir_stats WHERE address=?", self.tree),
+                         [(110, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
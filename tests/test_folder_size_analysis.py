@@ -0,0 +1,60 @@
+import importlib.machinery
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The script has no .py extension, so its loader is given explicitly
+loader = importlib.machinery.SourceFileLoader("folder_size_analysis", os.path.join(REPO_DIR, "Folder Size Analysis"))
+spec = importlib.util.spec_from_loader(loader.name, loader)
+folder_size_analysis = importlib.util.module_from_spec(spec)
+loader.exec_module(folder_size_analysis)
+
+
+class RefreshTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.tree = os.path.join(self.root, "tree")
+        for name in ("a", "b"):
+            os.makedirs(os.path.join(self.tree, name))
+        with open(os.path.join(self.tree, "a", "big"), "wb") as f:
+            f.write(b"x" * 100000)
+        os.link(os.path.join(self.tree, "a", "big"), os.path.join(self.tree, "b", "big"))
+
+    def scan_and_cache(self):
+        conn = folder_size_analysis.open_cache(os.path.join(self.root, "cache.db"))
+        self.addCleanup(conn.close)
+        folders = folder_size_analysis.scan_subtrees([self.tree])
+        folder_size_analysis.save_tree(conn, self.tree, False, folders, folder_size_analysis.roll_up(folders))
+        return conn
+
+    def test_hard_link_counted_once_after_refresh(self):
+        # Whichever folder counted the link first, re-listing either one must not count it again
+        for name in ("a", "b"):
+            with self.subTest(relisted=name):
+                conn = self.scan_and_cache()
+                with open(os.path.join(self.tree, name, f"new_{name}"), "wb") as f:
+                    f.write(b"x" * 10)
+                folders, totals = folder_size_analysis.load_tree(conn, self.tree)
+                self.assertEqual(totals[self.tree], 100000)
+                folders, changed, added = folder_size_analysis.refresh_tree(folders, self.tree)
+                self.assertEqual(changed, 1)
+                self.assertEqual(folder_size_analysis.roll_up(folders)[self.tree], 100010)
+                os.remove(os.path.join(self.tree, name, f"new_{name}"))
+
+    def test_new_subfolder_does_not_recount_link(self):
+        conn = self.scan_and_cache()
+        os.makedirs(os.path.join(self.tree, "c"))
+        os.link(os.path.join(self.tree, "a", "big"), os.path.join(self.tree, "c", "big"))
+        folders, totals = folder_size_analysis.load_tree(conn, self.tree)
+        folders, changed, added = folder_size_analysis.refresh_tree(folders, self.tree)
+        self.assertEqual(added, 1)
+        self.assertEqual(folder_size_analysis.roll_up(folders)[self.tree], 100000)
+
+
+if __name__ == "__main__":
+    unittest.main()
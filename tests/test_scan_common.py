@@ -0,0 +1,114 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scan_common
+
+
+class FilterTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_load_and_apply_rules(self):
+        rules_path = os.path.join(self.root, "rules.txt")
+        with open(rules_path, "w", encoding="utf-8") as f:
+            f.write("# comment\nexclude-dir node_modules\nexclude-dir cache_*\nexclude *.bak\ninclude-ext jpg\n")
+        rules = scan_common.load_filter_rules(rules_path)
+        self.assertEqual(rules[0], ("exclude-dir", "node_modules"))
+        file_filter = scan_common.compile_filter(scan_common.DEFAULT_FILTER_RULES + rules)
+        self.assertTrue(scan_common.file_allowed(file_filter, "photo.JPG"))
+        self.assertFalse(scan_common.file_allowed(file_filter, "notes.txt"))
+        self.assertFalse(scan_common.file_allowed(file_filter, "photo.jpg.bak"))
+        self.assertFalse(scan_common.dir_allowed(file_filter, "node_modules"))
+        self.assertFalse(scan_common.dir_allowed(file_filter, "cache_1"))
+        self.assertFalse(scan_common.dir_allowed(file_filter, "$RECYCLE.BIN"))
+        self.assertTrue(scan_common.dir_allowed(file_filter, "photos"))
+
+    def test_bad_rule_line(self):
+        rules_path = os.path.join(self.root, "rules.txt")
+        with open(rules_path, "w", encoding="utf-8") as f:
+            f.write("exclude-dir build\nbogus line\n")
+        with self.assertRaisesRegex(ValueError, "line 2"):
+            scan_common.load_filter_rules(rules_path)
+
+
+class CreateFilesTableTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.addCleanup(self.conn.close)
+
+    def test_migrates_original_layout(self):
+        folder = os.path.join(os.sep, "no_such_dir", "photos")
+        self.conn.execute("""CREATE TABLE files (id INTEGER PRIMARY KEY, type TEXT, file_format TEXT, name TEXT,
+                             address TEXT, size INTEGER, created_date TEXT)""")
+        self.conn.executemany("INSERT INTO files (type, file_format, name, address, size, created_date) "
+                              "VALUES ('file', '.jpg', ?, ?, ?, '2024-01-02 03:04:05')",
+                              [("a.jpg", os.path.join(folder, "a.jpg"), 2),
+                               ("b.jpg", os.path.join(folder, "b.jpg"), 3),
+                               ("b.jpg", os.path.join(folder, "b.jpg"), 3)])
+        scan_common.create_files_table(self.conn)
+        self.assertEqual(self.conn.execute("PRAGMA user_version").fetchone()[0], scan_common.SCHEMA_VERSION)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*), SUM(size) FROM files").fetchone(), (2, 5 * 1024))
+        self.assertEqual(self.conn.execute("SELECT total_size, file_count FROM dir_stats WHERE address=?",
+                                           (folder,)).fetchone(), (5 * 1024, 2))
+        self.assertEqual(self.conn.execute("SELECT mtime FROM scanned_dirs WHERE address=?", (folder,)).fetchone(),
+                         (None,))
+
+
+class ReconcileDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.conn = sqlite3.connect(":memory:")
+        self.addCleanup(self.conn.close)
+        scan_common.create_files_table(self.conn)
+
+    def write(self, name, size):
+        with open(os.path.join(self.root, name), "wb") as f:
+            f.write(b"x" * size)
+
+    def reconcile(self):
+        c = self.conn.cursor()
+        entries = scan_common.list_directory(self.root)
+        return scan_common.reconcile_directory(c, self.root, os.stat(self.root).st_mtime_ns, entries, True)
+
+    def totals(self):
+        return self.conn.execute("SELECT total_size, file_count FROM dir_stats WHERE address=?", (self.root,)).fetchone()
+
+    def test_deltas_match_rebuild(self):
+        self.write("a", 10)
+        self.write("b", 100)
+        subdirs, changed = self.reconcile()
+        self.assertEqual((subdirs, changed), ([], 2))
+        self.assertEqual(self.totals(), (110, 2))
+        os.remove(os.path.join(self.root, "a"))
+        self.write("b", 50)
+        self.write("c", 1)
+        self.assertEqual(self.reconcile()[1], 3)
+        self.assertEqual(self.totals(), (51, 2))
+        scan_common.rebuild_dir_stats(self.conn.cursor())
+        self.assertEqual(self.totals(), (51, 2))
+        self.assertEqual(dict(self.conn.execute("SELECT name, deleted FROM files")), {"a": 1, "b": 0, "c": 0})
+
+    def test_vanished_subfolder_is_marked_deleted(self):
+        os.makedirs(os.path.join(self.root, "sub"))
+        self.write(os.path.join("sub", "s"), 7)
+        subdirs, changed = self.reconcile()
+        sub = os.path.join(self.root, "sub")
+        c = self.conn.cursor()
+        scan_common.reconcile_directory(c, sub, os.stat(sub).st_mtime_ns, scan_common.list_directory(sub), True)
+        self.assertEqual(self.totals(), (7, 1))
+        shutil.rmtree(sub)
+        self.reconcile()
+        self.assertEqual(self.totals(), (0, 0))
+        self.assertEqual(set(self.conn.execute("SELECT deleted FROM files")), {(1,)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sort_helpers
+
+
+class ExternalSortTest(unittest.TestCase):
+    def test_spilled_runs_merge_in_order(self):
+        names = [f"file{i}" for i in range(50, 0, -1)] + ["line\nbreak", "tab\there"]
+        self.assertEqual(list(sort_helpers.external_sort(names, chunk_lines=7)), sorted(names))
+
+    def test_natural_key(self):
+        names = ["File10", "file2", "file1"]
+        self.assertEqual(list(sort_helpers.external_sort(names, key=sort_helpers.natural_key, chunk_lines=2)),
+                         ["file1", "file2", "File10"])
+
+
+class WriteLinesTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.path = os.path.join(self.root, "out.txt")
+
+    def read(self):
+        with open(self.path, encoding="utf-8") as f:
+            return f.read()
+
+    def test_header_is_not_counted(self):
+        self.assertEqual(sort_helpers.write_lines(self.path, iter(["a", "b", "c"]), "h", batch_lines=2), 3)
+        self.assertEqual(self.read(), "h\na\nb\nc\n")
+
+    def test_empty_listing_creates_empty_file(self):
+        self.assertEqual(sort_helpers.write_lines(self.path, []), 0)
+        self.assertEqual(self.read(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+import video_frame_extractor
+
+
+def write_video(path, frame_count=24, size=(64, 48)):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 12, size)
+    for i in range(frame_count):
+        writer.write(np.full((size[1], size[0], 3), i * 10 % 256, np.uint8))
+    writer.release()
+
+
+class DecodeFramesTest(unittest.TestCase):
+    def test_seeking_matches_sequential_decode(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        path = os.path.join(root, "video.mp4")
+        write_video(path, frame_count=60)
+        frame_numbers = [3, 4, 30, 58]
+        decoded = {}
+        for seek_gap in (1, 1000):
+            video = cv2.VideoCapture(path)
+            try:
+                decoded[seek_gap] = [(n, int(frame.mean())) for n, frame in
+                                     video_frame_extractor.decode_frames(video, frame_numbers, seek_gap)]
+            finally:
+                video.release()
+        self.assertEqual([n for n, level in decoded[1000]], frame_numbers)
+        self.assertEqual(decoded[1], decoded[1000])
+
+
+class GenerateThumbnailsTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.library = os.path.join(self.root, "library")
+        self.cache = os.path.join(self.root, "cache")
+        os.makedirs(self.library)
+        write_video(os.path.join(self.library, "good.mp4"))
+        self.bad = os.path.join(self.library, "bad.mp4")
+        with open(self.bad, "wb") as f:
+            f.write(b"not a video")
+
+    def generate(self):
+        return video_frame_extractor.generate_thumbnails(self.library, self.cache, count=2, workers=1)
+
+    def statuses(self):
+        conn = sqlite3.connect(os.path.join(self.cache, "thumbnails.db"))
+        try:
+            return dict(conn.execute("SELECT path, status FROM thumbnail_videos"))
+        finally:
+            conn.close()
+
+    def test_failed_videos_are_retried(self):
+        stats = self.generate()
+        self.assertEqual((stats['videos'], stats['failed']), (2, 1))
+        self.assertEqual(self.statuses()[self.bad], "failed")
+        # The good video is skipped, while the unchanged failure is tried again
+        stats = self.generate()
+        self.assertEqual((stats['videos'], stats['failed']), (1, 1))
+        # Once the video decodes, it is recorded as done and skipped from then on
+        os.remove(self.bad)
+        write_video(self.bad)
+        stats = self.generate()
+        self.assertEqual((stats['videos'], stats['failed']), (1, 0))
+        self.assertEqual(set(self.statuses().values()), {"done"})
+        self.assertEqual(self.generate()['videos'], 0)
+
+    def test_index_without_status_is_migrated(self):
+        os.makedirs(self.cache)
+        conn = sqlite3.connect(os.path.join(self.cache, "thumbnails.db"))
+        conn.execute("CREATE TABLE thumbnail_videos (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, "
+                     "frame_count INTEGER, error TEXT)")
+        st = os.stat(self.bad)
+        conn.execute("INSERT INTO thumbnail_videos VALUES (?, ?, ?, NULL, 'Unable to open video file.')",
+                     (self.bad, st.st_size, st.st_mtime_ns))
+        conn.commit()
+        conn.close()
+        stats = self.generate()
+        self.assertEqual((stats['videos'], stats['failed']), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,41 @@
 import cv2
 import os
+import sys
+import time
+import queue
+import sqlite3
+import hashlib
+import argparse
+import threading
+import concurrent.futures
+import numpy as np
 
-def extract_frame(video_path, frame_number):
+# Encoder threads used by the pipelined extraction; OpenCV releases the GIL while encoding
+ENCODER_WORKERS = os.cpu_count() or 1
+
+# Decoded frames waiting for an encoder; this bounds the memory the pipeline uses
+QUEUE_DEPTH = 16
+
+# Frames further ahead than this are reached by seeking, which decodes from the keyframe before them,
+# rather than by grabbing every frame in between
+SEEK_GAP = 300
+
+# Bulk thumbnail defaults: thumbnails per video, their width, the processes decoding videos and the
+# extensions picked up when scanning a directory (the same ones CineVault lists)
+THUMBNAIL_COUNT = 8
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_WORKERS = os.cpu_count() or 1
+VIDEO_EXTENSIONS = ('.mkv', '.mp4')
+
+# OpenCV write flag and default level per output format: PNG compression 0-9, JPEG and WebP quality 1-100.
+# PNG defaults to OpenCV's own setting, whose run-length strategy is much faster than any explicit level.
+IMAGE_FORMATS = {
+    'png': (cv2.IMWRITE_PNG_COMPRESSION, None),
+    'jpg': (cv2.IMWRITE_JPEG_QUALITY, 90),
+    'webp': (cv2.IMWRITE_WEBP_QUALITY, 80),
+}
+
+def extract_frame(video_path, frame_number, verbose=True):
     # Load the video
     video = cv2.VideoCapture(video_path)
     
@@ -29,22 +63,409 @@ def extract_frame(video_path, frame_number):
     output_path = f"{video_name}_frame_{frame_number}.png"
     cv2.imwrite(output_path, frame)
     
-    print(f"Frame {frame_number} extracted and saved as {output_path}")
+    if verbose:
+        print(f"Frame {frame_number} extracted and saved as {output_path}")
     
     return output_path
 
+def parse_timestamp(text):
+    # Accept seconds ("95.5s") or clock times ("1:35.5", "01:01:35")
+    if text.endswith('s'):
+        return float(text[:-1])
+    seconds = 0.0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def parse_frame_spec(spec, fps, frame_count):
+    # Turn a spec such as "10, 200-300, 400-1000:50, every 500, 1:30, 95.5s" into sorted frame numbers.
+    # Ranges are inclusive and may carry a step; timestamps are converted with the video's fps.
+    frames = set()
+    for item in spec.replace(';', ',').split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        if item.startswith('every '):
+            frames.update(range(0, frame_count, int(item[6:])))
+        elif ':' in item and '-' not in item or item.endswith('s'):
+            if fps <= 0:
+                raise ValueError("The video does not report its fps, so timestamps cannot be used.")
+            frames.add(int(round(parse_timestamp(item) * fps)))
+        elif '-' in item:
+            bounds, _, step = item.partition(':')
+            start, end = (int(bound) for bound in bounds.split('-'))
+            frames.update(range(start, end + 1, int(step) if step else 1))
+        else:
+            frames.add(int(item))
+    return sorted(frame for frame in frames if frame >= 0 and (frame < frame_count or frame_count <= 0))
+
+def decode_frames(video, frame_numbers, seek_gap=SEEK_GAP):
+    # Decode the video in one forward pass, skipping unwanted frames with grab() and decoding only the
+    # requested ones with retrieve(). Frames more than seek_gap frames ahead are sought to instead.
+    # Yields (frame_number, frame) in frame order.
+    position = 0
+    for frame_number in sorted(set(frame_numbers)):
+        if frame_number - position > seek_gap and video.set(cv2.CAP_PROP_POS_FRAMES, frame_number):
+            position = frame_number
+        # grab() only demuxes and decodes, without converting the frame into an image
+        while position < frame_number and video.grab():
+            position += 1
+        if position < frame_number or not video.grab():
+            print(f"Error: The video ends before frame {frame_number}.")
+            break
+        position += 1
+        ret, frame = video.retrieve()
+        if not ret:
+            print(f"Error: Unable to extract frame {frame_number} from the video.")
+            continue
+        yield frame_number, frame
+
+def extract_frames(video_path, frame_numbers, output_dir='.'):
+    # Write each requested frame as soon as the sequential pass reaches it
+    video = cv2.VideoCapture(video_path)
+    if not video.isOpened():
+        print("Error: Unable to open video file.")
+        return []
+    
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    output_paths = []
+    try:
+        for frame_number, frame in decode_frames(video, frame_numbers):
+            output_path = os.path.join(output_dir, f"{video_name}_frame_{frame_number}.png")
+            cv2.imwrite(output_path, frame)
+            output_paths.append(output_path)
+    finally:
+        video.release()
+    return output_paths
+
+def downscale(frame, max_width):
+    # Shrink a frame to max_width pixels wide, keeping its aspect ratio; smaller frames are left alone
+    height, width = frame.shape[:2]
+    if not max_width or width <= max_width:
+        return frame
+    return cv2.resize(frame, (max_width, max(1, round(height * max_width / width))), interpolation=cv2.INTER_AREA)
+
+def extract_frames_pipelined(video_path, frame_numbers, output_dir='.', image_format='png', level=None,
+                             max_width=None, sheet_grid=None, encoder_workers=ENCODER_WORKERS, queue_depth=QUEUE_DEPTH):
+    # One decoder thread feeds a bounded queue that a pool of encoder threads drains, so decoding and
+    # compression overlap. With sheet_grid=(columns, rows) the frames are tiled into contact sheets
+    # instead of being written one by one. Returns the written paths and the frames per second achieved.
+    video = cv2.VideoCapture(video_path)
+    if not video.isOpened():
+        print("Error: Unable to open video file.")
+        return [], 0.0
+    
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    flag, default_level = IMAGE_FORMATS[image_format]
+    level = default_level if level is None else level
+    params = [] if level is None else [flag, level]
+    wanted = sorted(set(frame_numbers))
+    tiles_per_sheet = sheet_grid[0] * sheet_grid[1] if sheet_grid else 0
+    frame_queue = queue.Queue(maxsize=queue_depth)
+    output_paths = []
+    errors = []
+    sheets = {}
+    lock = threading.Lock()
+    
+    def write_image(output_path, image):
+        if not cv2.imwrite(output_path, image, params):
+            raise OSError(f"Unable to write {output_path}")
+        with lock:
+            output_paths.append(output_path)
+    
+    def add_tile(index, frame):
+        # Tiles land on their sheet in any order; the encoder that fills the last slot writes the sheet
+        sheet_number, slot = divmod(index, tiles_per_sheet)
+        tile_count = min(tiles_per_sheet, len(wanted) - sheet_number * tiles_per_sheet)
+        with lock:
+            if sheet_number not in sheets:
+                height, width = frame.shape[:2]
+                sheets[sheet_number] = [np.zeros((height * sheet_grid[1], width * sheet_grid[0], 3), np.uint8), 0]
+            sheet = sheets[sheet_number]
+            row, column = divmod(slot, sheet_grid[0])
+            height, width = frame.shape[:2]
+            sheet[0][row * height:(row + 1) * height, column * width:(column + 1) * width] = frame
+            sheet[1] += 1
+            if sheet[1] < tile_count:
+                return
+            del sheets[sheet_number]
+        write_image(os.path.join(output_dir, f"{video_name}_sheet_{sheet_number + 1}.{image_format}"), sheet[0])
+    
+    def encode_worker():
+        while True:
+            item = frame_queue.get()
+            if item is None:
+                break
+            index, frame_number, frame = item
+            try:
+                frame = downscale(frame, max_width)
+                if sheet_grid:
+                    add_tile(index, frame)
+                else:
+                    write_image(os.path.join(output_dir, f"{video_name}_frame_{frame_number}.{image_format}"), frame)
+            except Exception as e:
+                errors.append(e)
+    
+    encoders = [threading.Thread(target=encode_worker, daemon=True) for _ in range(encoder_workers)]
+    for encoder in encoders:
+        encoder.start()
+    start_time = time.perf_counter()
+    decoded = 0
+    try:
+        for index, (frame_number, frame) in enumerate(decode_frames(video, wanted)):
+            frame_queue.put((index, frame_number, frame))
+            decoded += 1
+    finally:
+        video.release()
+        for _ in encoders:
+            frame_queue.put(None)
+        for encoder in encoders:
+            encoder.join()
+    elapsed = time.perf_counter() - start_time
+    
+    # A video that ends early leaves its last sheet partly filled
+    for sheet_number, (image, count) in sorted(sheets.items()):
+        write_image(os.path.join(output_dir, f"{video_name}_sheet_{sheet_number + 1}.{image_format}"), image)
+    for error in errors:
+        print(f"Error: {error}")
+    return sorted(output_paths), decoded / elapsed if elapsed else 0.0
+
+def benchmark_extraction(video_path, frame_numbers):
+    # Compare one sequential pass against one seek per frame, as extract_frame does
+    start_time = time.perf_counter()
+    for frame_number in frame_numbers:
+        extract_frame(video_path, frame_number, verbose=False)
+    seek_time = time.perf_counter() - start_time
+    
+    start_time = time.perf_counter()
+    extract_frames(video_path, frame_numbers)
+    pass_time = time.perf_counter() - start_time
+    
+    print(f"{'Method':<18} {'Seconds':<10} {'Frames/sec':<12}")
+    print("-" * 40)
+    print(f"{'Seek per frame':<18} {seek_time:<10.2f} {len(frame_numbers) / seek_time:<12.1f}")
+    print(f"{'Sequential pass':<18} {pass_time:<10.2f} {len(frame_numbers) / pass_time:<12.1f}")
+    print(f"Speedup: {seek_time / pass_time:.2f}x")
+
+def video_properties(video_path):
+    # Read the frame rate and frame count needed to interpret frame specs
+    video = cv2.VideoCapture(video_path)
+    fps = video.get(cv2.CAP_PROP_FPS)
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    return fps, frame_count
+
+def create_thumbnail_index(conn):
+    # The index maps each video, as of the size and mtime it had when processed, to its thumbnails and
+    # status ('done' or 'failed'). Thumbnail files are named by the SHA-256 of their bytes, so identical
+    # frames are stored once.
+    conn.execute('''CREATE TABLE IF NOT EXISTS thumbnail_videos (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER,
+                        mtime INTEGER,
+                        frame_count INTEGER,
+                        error TEXT,
+                        status TEXT
+                    )''')
+    # Indexes written before failures had their own status tell them apart by the error column
+    if 'status' not in {row[1] for row in conn.execute("PRAGMA table_info(thumbnail_videos)")}:
+        conn.execute("ALTER TABLE thumbnail_videos ADD COLUMN status TEXT")
+        conn.execute("UPDATE thumbnail_videos SET status = CASE WHEN error IS NULL THEN 'done' ELSE 'failed' END")
+    conn.execute('''CREATE TABLE IF NOT EXISTS thumbnails (
+                        path TEXT,
+                        position INTEGER,
+                        frame_number INTEGER,
+                        digest TEXT,
+                        PRIMARY KEY (path, position)
+                    )''')
+    conn.commit()
+
+def thumbnail_path(cache_dir, digest, image_format):
+    # Spread the cache over 256 subfolders so no folder grows too large
+    return os.path.join(cache_dir, digest[:2], f"{digest}.{image_format}")
+
+def list_library_videos(source):
+    # Take the videos from a CineVault database or from a directory tree
+    if os.path.isfile(source):
+        conn = sqlite3.connect(source)
+        try:
+            paths = [os.path.join(directory, file_name)
+                     for directory, file_name in conn.execute("SELECT directory, file_name FROM video")]
+        finally:
+            conn.close()
+    else:
+        paths = [os.path.join(root, file) for root, dirs, files in os.walk(source)
+                 for file in files if file.lower().endswith(VIDEO_EXTENSIONS)]
+    return sorted(paths)
+
+def init_thumbnail_worker():
+    # Each process runs one decoder; OpenCV's own threads would only compete with the other processes
+    cv2.setNumThreads(1)
+
+def thumbnail_video(video_path, cache_dir, count=THUMBNAIL_COUNT, max_width=THUMBNAIL_WIDTH, image_format='jpg'):
+    # Grab count evenly spaced frames through decode_frames, which seeks between frames that are far apart.
+    # Returns the frame count and (position, frame_number, digest) for each thumbnail.
+    video = cv2.VideoCapture(video_path)
+    if not video.isOpened():
+        raise OSError("Unable to open video file.")
+    try:
+        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count <= 0:
+            raise OSError("The video does not report its frame count.")
+        flag, level = IMAGE_FORMATS[image_format]
+        params = [] if level is None else [flag, level]
+        thumbnails = []
+        frame_numbers = [int((position + 0.5) * frame_count / count) for position in range(count)]
+        frames = dict(decode_frames(video, frame_numbers))
+        for position, frame_number in enumerate(frame_numbers):
+            frame = frames.get(frame_number)
+            if frame is None:
+                continue
+            ret, encoded = cv2.imencode(f".{image_format}", downscale(frame, max_width), params)
+            if not ret:
+                continue
+            data = encoded.tobytes()
+            digest = hashlib.sha256(data).hexdigest()
+            output_path = thumbnail_path(cache_dir, digest, image_format)
+            if not os.path.exists(output_path):
+                # Write under a temporary name first, so an interrupted run never leaves a truncated thumbnail
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                temp_path = f"{output_path}.{os.getpid()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, output_path)
+            thumbnails.append((position, frame_number, digest))
+        return frame_count, thumbnails
+    finally:
+        video.release()
+
+def generate_thumbnails(source, cache_dir, count=THUMBNAIL_COUNT, max_width=THUMBNAIL_WIDTH, image_format='jpg',
+                        workers=THUMBNAIL_WORKERS):
+    # Thumbnail every video of a directory or CineVault database into cache_dir. Videos done with the size
+    # and mtime in the index are skipped, while failed ones are tried again. Results are committed as they
+    # arrive, so an interrupted run resumes.
+    os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(cache_dir, "thumbnails.db"))
+    create_thumbnail_index(conn)
+    known = {path: (size, mtime)
+             for path, size, mtime in conn.execute("SELECT path, size, mtime FROM thumbnail_videos WHERE status='done'")}
+    todo = {}
+    for video_path in list_library_videos(source):
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            continue
+        if known.get(video_path) != (st.st_size, st.st_mtime_ns):
+            todo[video_path] = (st.st_size, st.st_mtime_ns)
+    print(f"{len(todo)} videos to process, {len(known)} already indexed.")
+    
+    stats = {'videos': 0, 'thumbnails': 0, 'failed': 0}
+    start_time = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_thumbnail_worker) as executor:
+        futures = {executor.submit(thumbnail_video, video_path, cache_dir, count, max_width, image_format): video_path
+                   for video_path in todo}
+        for future in concurrent.futures.as_completed(futures):
+            video_path = futures[future]
+            size, mtime = todo[video_path]
+            try:
+                frame_count, thumbnails = future.result()
+                error = None
+            except Exception as e:
+                frame_count, thumbnails, error = None, [], str(e)
+                stats['failed'] += 1
+                print(f"Error: {video_path}: {error}")
+            conn.execute("DELETE FROM thumbnails WHERE path=?", (video_path,))
+            conn.executemany("INSERT INTO thumbnails (path, position, frame_number, digest) VALUES (?, ?, ?, ?)",
+                             [(video_path,) + thumbnail for thumbnail in thumbnails])
+            conn.execute("INSERT OR REPLACE INTO thumbnail_videos (path, size, mtime, frame_count, error, status) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (video_path, size, mtime, frame_count, error, 'failed' if error else 'done'))
+            conn.commit()
+            stats['videos'] += 1
+            stats['thumbnails'] += len(thumbnails)
+            if stats['videos'] % 100 == 0:
+                elapsed = time.perf_counter() - start_time
+                print(f"{stats['videos']}/{len(todo)} videos, {stats['videos'] / elapsed:.1f} videos/sec")
+    conn.close()
+    elapsed = time.perf_counter() - start_time
+    print(f"Done: {stats['videos']} videos, {stats['thumbnails']} thumbnails, {stats['failed']} failed "
+          f"in {elapsed:.2f} seconds.")
+    return stats
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Extract evenly spaced thumbnails from every video of a library.")
+    parser.add_argument('--thumbnails', metavar='SOURCE', required=True,
+                        help="a directory of videos or a CineVault database")
+    parser.add_argument('--cache', default='thumbnail_cache', help="folder holding the thumbnails and their index")
+    parser.add_argument('--count', type=int, default=THUMBNAIL_COUNT, help="thumbnails per video")
+    parser.add_argument('--width', type=int, default=THUMBNAIL_WIDTH, help="maximum thumbnail width in pixels")
+    parser.add_argument('--format', choices=sorted(IMAGE_FORMATS), default='jpg', help="thumbnail image format")
+    parser.add_argument('--workers', type=int, default=THUMBNAIL_WORKERS, help="videos decoded in parallel")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    # Any command-line arguments select the non-interactive bulk thumbnail mode
+    if len(sys.argv) > 1:
+        args = parse_arguments(sys.argv[1:])
+        generate_thumbnails(args.thumbnails, args.cache, args.count, args.width, args.format, args.workers)
+        sys.exit()
+    
     # Prompt the user for the video file path
     video_path = input("Enter the video file path (.mkv): ")
     
     while True:
-        # Prompt the user for the frame number
-        frame_number = int(input("Enter the frame number to extract: "))
-        
-        # Extract the frame
-        extracted_frame_path = extract_frame(video_path, frame_number)
+        print("\n1. Extract a single frame")
+        print("2. Extract many frames in one pass")
+        print("3. Benchmark one pass against seeking per frame")
+        print("4. Extract frames or contact sheets with parallel encoders")
+        print("5. Exit")
+        mode = input("Enter your choice (1-5): ")
         
-        # Ask the user if they want to extract another frame
-        choice = input("Do you want to extract another frame from this video? (yes/no): ").lower()
-        if choice != 'yes':
+        if mode == '1':
+            # Prompt the user for the frame number
+            frame_number = int(input("Enter the frame number to extract: "))
+            
+            # Extract the frame
+            extracted_frame_path = extract_frame(video_path, frame_number)
+        elif mode in ('2', '3', '4'):
+            fps, frame_count = video_properties(video_path)
+            print(f"The video has {frame_count} frames at {fps:.3f} fps.")
+            spec = input("Enter frames (e.g. 10, 200-300, 400-1000:50, every 500, 1:30, 95.5s): ")
+            try:
+                frame_numbers = parse_frame_spec(spec, fps, frame_count)
+            except ValueError as e:
+                print(f"Error: {e}")
+                continue
+            if mode == '2':
+                output_dir = input("Enter the output folder (default: current folder): ") or '.'
+                os.makedirs(output_dir, exist_ok=True)
+                start_time = time.perf_counter()
+                output_paths = extract_frames(video_path, frame_numbers, output_dir)
+                elapsed = time.perf_counter() - start_time
+                print(f"{len(output_paths)} frames extracted to {output_dir} in {elapsed:.2f} seconds.")
+            elif mode == '3':
+                benchmark_extraction(video_path, frame_numbers)
+            else:
+                output_dir = input("Enter the output folder (default: current folder): ") or '.'
+                os.makedirs(output_dir, exist_ok=True)
+                image_format = input("Image format (png/jpg/webp, default png): ").lower() or 'png'
+                if image_format not in IMAGE_FORMATS:
+                    print("Invalid format.")
+                    continue
+                level = input(f"Compression level (PNG 0-9, JPEG/WebP quality 1-100, default {IMAGE_FORMATS[image_format][1] or 'automatic'}): ")
+                max_width = input("Maximum width in pixels (blank to keep the original size): ")
+                grid = input("Contact sheet columns x rows, e.g. 5x4 (blank for separate images): ").lower()
+                try:
+                    sheet_grid = tuple(int(part) for part in grid.split('x')) if grid else None
+                    if sheet_grid and (len(sheet_grid) != 2 or min(sheet_grid) < 1):
+                        raise ValueError
+                    output_paths, frames_per_second = extract_frames_pipelined(
+                        video_path, frame_numbers, output_dir, image_format, int(level) if level else None,
+                        int(max_width) if max_width else None, sheet_grid)
+                except ValueError:
+                    print("Invalid number.")
+                    continue
+                print(f"{len(output_paths)} images written to {output_dir} at {frames_per_second:.1f} frames/sec.")
+        elif mode == '5':
             break
+        else:
+            print("Invalid choice. Please enter a number from 1 to 5.")